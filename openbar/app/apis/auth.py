@@ -4,18 +4,21 @@
 """
 API for authentification
 """
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from starlette import status
 
+from models.loginevent import LoginEvent, login_history
 from models.user import User, search_user, verify_user_password, \
     update_last_login
+from schemas.loginevent import LoginEventOut
 from tools.auth import login_user
-from tools.db import get_db
-
-local_history = []
+from tools.db import get_db, get_read_db
+from tools.executor import crypto_executor
+from tools.pagination import Page, filter_date_range
 
 router = APIRouter(
     prefix="/auth",
@@ -51,12 +54,12 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     if not partial_login and form_data.username.startswith('username:'):
         try:
             username = form_data.username.removeprefix('username:')
-            user = User.get(User.username == username)
+            user = await crypto_executor.run(User.get, User.username == username)
         except User.DoesNotExist:
             raise incorrect
     elif form_data.username.startswith('card_id:'):
         card_id = form_data.username.removeprefix('card_id:')
-        user = search_user(card_id)
+        user = await crypto_executor.run(search_user, card_id)
         if user is None:
             raise incorrect
     elif form_data.username.startswith('token:'):
@@ -70,21 +73,30 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             Please see API documentation for more information.""",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    local_history.append(user.id)
 
-    if not partial_login and not verify_user_password(user, form_data.password):
+    if not partial_login and not await crypto_executor.run(verify_user_password, user, form_data.password):
+        login_history.record(user.id, succeeded=False)
         raise incorrect
+    login_history.record(user.id, succeeded=True, partial=partial_login)
 
     # User is now authenticated, we can proceed
     update_last_login(user)
-    token = login_user(user, partial_login)
+    token = await crypto_executor.run(login_user, user, partial_login)
     return {"access_token": token, "token_type": "bearer"}
 
 
-@router.get('/history', dependencies=[Depends(get_db)])
-def get_history() -> List[int]:
+@router.get('/history', response_model=List[LoginEventOut], dependencies=[Depends(get_read_db)])
+def get_history(page: Page = Depends(),
+                user: Optional[int] = None,
+                created_after: Optional[datetime] = None,
+                created_before: Optional[datetime] = None) -> List[LoginEventOut]:
     """
-    Fetch the history
+    Get a page of the login history
+    The logins are written to the database by each worker every LOGIN_HISTORY_FLUSH_INTERVAL seconds,
+    the last ones may not be there yet.
     """
-    # TODO: Correctly save history
-    return local_history
+    query = LoginEvent.select()
+    if user is not None:
+        query = query.where(LoginEvent.user == user)
+    query = filter_date_range(query, LoginEvent.created_at, created_after, created_before)
+    return list(page.apply(query, LoginEvent.id))
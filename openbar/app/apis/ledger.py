@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+API of the balance ledger
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from starlette import status
+
+from models.ledger import balance_at, statement
+from models.user import User as UserDAO
+from schemas.ledger import Balance, Statement
+from tools.db import get_read_db
+
+router = APIRouter(
+    prefix="/ledger",
+    tags=["ledger", "user"],
+)
+
+
+def check_user(user_id: int) -> None:
+    """Raise a 404 error if the user doesn't exist"""
+    if not UserDAO.select().where(UserDAO.id == user_id).exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="This user doesn't exist.")
+
+
+@router.get('/{user_id}/balance', response_model=Balance, dependencies=[Depends(get_read_db)])
+def get_balance(user_id: int, date: Optional[datetime] = None) -> Balance:
+    """
+    Get the balance of a user at a date, now by default
+    """
+    check_user(user_id)
+    if date is None:
+        date = datetime.now()
+    return Balance(user=user_id, date=date, balance=balance_at(user_id, date))
+
+
+@router.get('/{user_id}/statement', response_model=Statement, dependencies=[Depends(get_read_db)])
+def get_statement(user_id: int, start: datetime, end: Optional[datetime] = None) -> Statement:
+    """
+    Get the movements of the balance of a user between two dates, with the balance before and after them
+    """
+    check_user(user_id)
+    if end is None:
+        end = datetime.now()
+    opening_balance, movements = statement(user_id, start, end)
+    return Statement(user=user_id, start=start, end=end,
+                     opening_balance=opening_balance,
+                     closing_balance=opening_balance + sum(movement.amount for movement in movements),
+                     movements=movements)
@@ -5,18 +5,24 @@
 API for ordering
 """
 
+import asyncio
+from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from starlette import status
-from starlette.responses import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
 
-from models.order import Order as OrderDAO, OrderProduct as OrderProductDAO, OrderStatus, validate_order,\
-    cancel_order_by, finish_the_order
+from config import ORDER_EVENTS_HEARTBEAT
+from models.order import Order as OrderDAO, OrderProduct as OrderProductDAO, OrderEvent as OrderEventDAO, \
+    OrderStatus, order_events, validate_order, cancel_order_by, finish_the_order, set_order_product, \
+    set_order_products, delete_basket
 from models.user import User as UserDAO
-from schemas.order import Order, OrderProduct
+from schemas.order import BasketItem, Order, OrderEvent, OrderProduct
 from tools.auth import get_current_user
-from tools.db import get_db
+from tools.db import get_db, get_read_db, release_connection_after
+from tools.pagination import Page, filter_date_range
 
 router = APIRouter(
     prefix="/order",
@@ -24,23 +30,94 @@ router = APIRouter(
 )
 
 
-@router.get('/', response_model=List[Order], dependencies=[Depends(get_db)])
-def get_orders() -> List[Order]:
+def filter_orders(query, order_status: Optional[int], client: Optional[int], barman: Optional[int],
+                  created_after: Optional[datetime], created_before: Optional[datetime]):
+    """Return the query restricted to the orders matching the given filters"""
+    if order_status is not None:
+        query = query.where(OrderDAO.status == order_status)
+    if client is not None:
+        query = query.where(OrderDAO.client == client)
+    if barman is not None:
+        query = query.where(OrderDAO.barman == barman)
+    return filter_date_range(query, OrderDAO.created_at, created_after, created_before)
+
+
+@router.get('/', response_model=List[Order], dependencies=[Depends(get_read_db)])
+def get_orders(page: Page = Depends(),
+               order_status: Optional[int] = Query(None, alias='status',
+                                                   description='Value of the order status'),
+               client: Optional[int] = None,
+               barman: Optional[int] = None,
+               created_after: Optional[datetime] = None,
+               created_before: Optional[datetime] = None) -> List[Order]:
     """
-    Get all orders and baskets
+    Get a page of the orders and baskets
     """
-    return list(OrderDAO.select())
+    query = filter_orders(OrderDAO.select(), order_status, client, barman, created_after, created_before)
+    return list(page.apply(query, OrderDAO.id))
 
 
-@router.get('/complete', response_model=List[Order], dependencies=[Depends(get_db)])
-def get_complete_orders() -> List[Order]:
+@router.get('/complete', response_model=List[Order], dependencies=[Depends(get_read_db)])
+def get_complete_orders(page: Page = Depends(),
+                        order_status: Optional[int] = Query(None, alias='status',
+                                                            description='Value of the order status'),
+                        client: Optional[int] = None,
+                        barman: Optional[int] = None,
+                        created_after: Optional[datetime] = None,
+                        created_before: Optional[datetime] = None) -> List[Order]:
     """
-    Get all orders without incomplete baskets
+    Get a page of the orders without incomplete baskets
     """
-    return list(OrderDAO.select().where(OrderDAO.status != OrderStatus.IN_BASKET.value))
+    query = OrderDAO.select().where(OrderDAO.status != OrderStatus.IN_BASKET.value)
+    query = filter_orders(query, order_status, client, barman, created_after, created_before)
+    return list(page.apply(query, OrderDAO.id))
+
+
+def format_order_event(event: OrderEventDAO) -> str:
+    """Return the order event as a Server-Sent Event"""
+    name = OrderStatus(event.status).name.lower()
+    return f"id: {event.id}\nevent: {name}\ndata: {OrderEvent.from_orm(event).json()}\n\n"
+
 
+@router.get('/events', dependencies=[Depends(get_db)], response_class=StreamingResponse)
+async def stream_order_events(request: Request,
+                              last_event_id: Optional[int] = Header(None, description='Id of the last event received, '
+                                                                                 'the stream resumes after it')):
+    """
+    Stream the changes of status of the orders as Server-Sent Events, named after the new status
+    A client reconnecting with the Last-Event-ID header first receives the events it missed.
+    A comment is sent when there was no event for ORDER_EVENTS_HEARTBEAT seconds.
+    """
+    after_id = last_event_id
+    if after_id is None:
+        after_id = await run_in_threadpool(release_connection_after, order_events.last_id)
+    subscription = order_events.subscribe(after_id)
+
+    async def stream():
+        try:
+            # The events written before the subscription, or while it was being made, may only be in the database
+            sent = set()
+            missed = await run_in_threadpool(release_connection_after, order_events.since, after_id)
+            for event in missed:
+                sent.add(event.id)
+                yield format_order_event(event)
+            while not await request.is_disconnected():
+                try:
+                    event = await subscription.get(ORDER_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                if event.id not in sent:
+                    yield format_order_event(event)
+        finally:
+            order_events.unsubscribe(subscription)
 
-@router.get('/{order_id}', response_model=List[OrderProduct], dependencies=[Depends(get_db)])
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get('/{order_id}', response_model=List[OrderProduct], dependencies=[Depends(get_read_db)])
 def get_order_product(order_id: int) -> List[OrderProduct]:
     """
     Get all product from an order
@@ -73,12 +150,37 @@ def empty_basket(login_info: tuple[UserDAO, List[str]] = Depends(get_current_use
     Delete all items in the basket of the logged user
     """
     user = login_info[0]
+    order = OrderDAO.get_or_none((OrderDAO.client == user) & (OrderDAO.status == OrderStatus.IN_BASKET.value))
+    if order is not None:
+        delete_basket(order)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def get_or_create_basket(user: UserDAO) -> OrderDAO:
+    """Return the basket of the user, it is created if it doesn't exist"""
     try:
-        query = OrderDAO.delete0().where((OrderDAO.client == user) & (OrderDAO.status == OrderStatus.IN_BASKET.value))
-        query.execute()
+        return OrderDAO.get((OrderDAO.client == user) & (OrderDAO.status == OrderStatus.IN_BASKET.value))
     except OrderDAO.DoesNotExist:
-        pass
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+        order = OrderDAO(client=user)
+        order.save()
+        return order
+
+
+@router.put('/basket/items', response_model=List[OrderProduct], dependencies=[Depends(get_db)])
+def set_items(items: List[BasketItem],
+              login_info: tuple[UserDAO, List[str]] = Depends(get_current_user)) -> List[OrderProduct]:
+    """
+    Add, update or remove several items in the basket of the logged user at once
+    An item with a quantity of 0 is removed. If a product is given several times, the last quantity is kept.
+    """
+    if any(item.quantity < 0 for item in items):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The quantity must be positive.")
+    order = get_or_create_basket(login_info[0])
+    quantities = {item.product: item.quantity for item in items}
+    # TODO: product price
+    return set_order_products(order, quantities, unit_price=1)
 
 
 @router.put('/basket/items/{product_id}', response_model=Optional[OrderProduct], dependencies=[Depends(get_db)])
@@ -92,27 +194,9 @@ def add_item(product_id: int,
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="The quantity must be positive.")
-    user = login_info[0]
-    try:
-        order = OrderDAO.get((OrderDAO.client == user) & (OrderDAO.status == OrderStatus.IN_BASKET.value))
-    except OrderDAO.DoesNotExist:
-        order = OrderDAO(client=user)
-        order.save()
-
-    if quantity == 0:
-        try:
-            query = OrderProductDAO.delete().where((OrderProductDAO.order == order)
-                                                   & (OrderProductDAO.product == product_id))
-            query.execute()
-        except OrderProductDAO.DoesNotExist:
-            pass
-        return None
+    order = get_or_create_basket(login_info[0])
     # TODO: product price
-    op, _ = OrderProductDAO.get_or_create(order=order,
-                                          product=product_id,
-                                          quantity=quantity,
-                                          unit_price=1)
-    return op
+    return set_order_product(order, product_id, quantity, unit_price=1)
 
 
 @router.put('/basket/validate', response_model=Order, dependencies=[Depends(get_db)])
@@ -7,16 +7,17 @@ API for recharges
 
 import logging
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from starlette import status
 
-from models.recharge import Recharge as RechargeDAO
+from models.recharge import Recharge as RechargeDAO, create_recharges
 from models.user import User as UserDAO
-from schemas.recharge import RechargeIn, RechargeOut
+from schemas.recharge import RechargeIn, RechargeOut, RechargeResult
 from tools.auth import get_current_user
-from tools.db import get_db
+from tools.db import get_db, get_read_db
+from tools.pagination import Page, filter_date_range
 
 log = logging.getLogger(__name__)
 
@@ -26,16 +27,25 @@ router = APIRouter(
 )
 
 
-@router.get('/', response_model=List[RechargeOut], dependencies=[Depends(get_db)])
-def get_all_recharges() -> List[RechargeOut]:
+@router.get('/', response_model=List[RechargeOut], dependencies=[Depends(get_read_db)])
+def get_all_recharges(page: Page = Depends(),
+                      client: Optional[int] = None,
+                      barman: Optional[int] = None,
+                      created_after: Optional[datetime] = None,
+                      created_before: Optional[datetime] = None) -> List[RechargeOut]:
     """
-    Get all recharges
+    Get a page of the recharges
     """
     recharges = RechargeDAO.select()
-    return list(recharges)
+    if client is not None:
+        recharges = recharges.where(RechargeDAO.client == client)
+    if barman is not None:
+        recharges = recharges.where(RechargeDAO.barman == barman)
+    recharges = filter_date_range(recharges, RechargeDAO.created_at, created_after, created_before)
+    return list(page.apply(recharges, RechargeDAO.id))
 
 
-@router.get('/{recharge_id}', response_model=RechargeOut, dependencies=[Depends(get_db)])
+@router.get('/{recharge_id}', response_model=RechargeOut, dependencies=[Depends(get_read_db)])
 def get_recharge(recharge_id: int) -> RechargeOut:
     """
     Get a recharge given its ID
@@ -62,17 +72,40 @@ def new_recharge(body: RechargeIn,
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="The value must be strictly positive.")
 
-    try:
-        user = UserDAO.get(UserDAO.id == body.client)
-    except UserDAO.DoesNotExist:
+    if not UserDAO.select().where(UserDAO.id == body.client).exists():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="This user doesn't exist.")
 
-    recharge = RechargeDAO(barman=current_user, client=user, value=body.value, created_at=datetime.now())
-    recharge.save()
+    return create_recharges(current_user, [(body.client, body.value)])[0]
 
-    user.balance += body.value
-    user.save()
 
-    return recharge
+@router.post('/batch', response_model=List[RechargeResult], dependencies=[Depends(get_db)])
+def new_recharges(body: List[RechargeIn],
+                  login_info: tuple[UserDAO, List[str]] = Depends(get_current_user)) -> List[RechargeResult]:
+    """
+    Create several recharges at once, for example for a cash desk session
+    The valid recharges are all created in one transaction, the result of each one is given in the same order.
+    """
+    current_user = login_info[0]
+    clients = list({item.client for item in body})
+    existing = {user_id for (user_id,) in UserDAO.select(UserDAO.id).where(UserDAO.id.in_(clients)).tuples()}
+
+    results = []
+    accepted = []
+    for item in body:
+        result = RechargeResult(client=item.client, value=item.value, status=status.HTTP_201_CREATED)
+        if item.value <= 0:
+            result.status = status.HTTP_400_BAD_REQUEST
+            result.detail = "The value must be strictly positive."
+        elif item.client not in existing:
+            result.status = status.HTTP_404_NOT_FOUND
+            result.detail = "This user doesn't exist."
+        else:
+            accepted.append(result)
+        results.append(result)
+
+    recharges = create_recharges(current_user, [(result.client, result.value) for result in accepted])
+    for result, recharge in zip(accepted, recharges):
+        result.recharge = RechargeOut.from_orm(recharge)
+    return results
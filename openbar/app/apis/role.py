@@ -11,8 +11,8 @@ from starlette import status
 from starlette.responses import Response
 
 from schemas.role import RoleIn, RoleOut, RoleUpdate
-from models.role import Role as RoleDAO, test_parent_validity
-from tools.db import get_db
+from models.role import Role as RoleDAO, test_parent_validity, role_permission_cache, role_tree_cache
+from tools.db import get_db, get_read_db
 
 router = APIRouter(
     prefix="/role",
@@ -20,7 +20,7 @@ router = APIRouter(
 )
 
 
-@router.get('/', response_model=List[RoleOut], dependencies=[Depends(get_db)])
+@router.get('/', response_model=List[RoleOut], dependencies=[Depends(get_read_db)])
 def role_user() -> List[RoleOut]:
     """
     List all roles
@@ -43,6 +43,7 @@ def create_role(body: RoleIn) -> RoleOut:
                 detail="The parent role doesn't exist")
     role = RoleDAO(**payload)
     role.save()
+    role_tree_cache.invalidate()
     return role
 
 
@@ -52,10 +53,12 @@ def delete_role() -> Response:
     Delete all role
     """
     RoleDAO.delete().execute()
+    role_permission_cache.invalidate()
+    role_tree_cache.invalidate()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
-@router.get('/{role_id}', response_model=RoleOut, dependencies=[Depends(get_db)])
+@router.get('/{role_id}', response_model=RoleOut, dependencies=[Depends(get_read_db)])
 def get_role(role_id: int) -> RoleOut:
     """
     Fetch a given role
@@ -87,6 +90,8 @@ def update_role(role_id: int, body: RoleUpdate) -> RoleOut:
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="The parent doesn't exist")
         RoleDAO.update(**payload).where(RoleDAO.id == role_id).execute()
+        if 'parent' in payload:
+            role_tree_cache.invalidate()
         return RoleDAO[role_id]
     except RoleDAO.DoesNotExist:
         raise HTTPException(
@@ -105,4 +110,6 @@ def delete_role(role_id: int) -> Response:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="This role doesn't exist")
+    role_permission_cache.invalidate()
+    role_tree_cache.invalidate()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
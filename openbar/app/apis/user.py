@@ -16,9 +16,10 @@ from models.cardsalt import CardSalt
 from models.user import User as UserDAO, search_user
 from models.role import Role as RoleDAO
 from schemas.user import UserOut, UserIn, CardID, UserUpdate
-from tools.auth import get_current_user
-from tools.crypto import generate_salt, hash_password, hash_card_id
-from tools.db import get_db
+from tools.auth import get_current_user, invalidate_user
+from tools.crypto import generate_salt, hash_password, hash_card_id, card_blind_index
+from tools.db import get_db, get_read_db
+from tools.pagination import Page
 
 router = APIRouter(
     prefix="/user",
@@ -26,12 +27,12 @@ router = APIRouter(
 )
 
 
-@router.get('/', response_model=List[UserOut], dependencies=[Depends(get_db)])
-def list_user() -> List[UserOut]:
+@router.get('/', response_model=List[UserOut], dependencies=[Depends(get_read_db)])
+def list_user(page: Page = Depends()) -> List[UserOut]:
     """
-    List all user
+    List a page of the users
     """
-    return list(UserDAO.select())
+    return list(page.apply(UserDAO.select(), UserDAO.id))
 
 
 def verifying_secrets(payload: dict[str, Any]):
@@ -80,6 +81,7 @@ def create_user(body: UserIn) -> UserOut:
 
     verifying_secrets(payload)
 
+    payload['card_index'] = card_blind_index(payload['card_id'])
     payload['card_id'] = hash_card_id(payload['card_id'],
                                       payload['salt'].salt)
     user_obj = UserDAO(**payload)
@@ -87,7 +89,7 @@ def create_user(body: UserIn) -> UserOut:
     return user_obj
 
 
-@router.get('/{user_id}', response_model=UserOut, dependencies=[Depends(get_db)])
+@router.get('/{user_id}', response_model=UserOut, dependencies=[Depends(get_read_db)])
 def get_user(user_id: int) -> UserOut:
     """
     Get a user given its identifier
@@ -106,7 +108,8 @@ def get_logged_user(login_info: tuple[UserDAO, List[str]] = Depends(get_current_
     """
     Get the user corresponding to the auth headers
     """
-    return login_info[0]
+    # The user given by the authentication can be a cached snapshot, the balance must be up to date
+    return UserDAO[login_info[0].id]
 
 
 @router.put('/{user_id}', response_model=UserOut, dependencies=[Depends(get_db)])
@@ -130,6 +133,7 @@ def put_user(user_id: int, body: UserUpdate) -> UserOut:
     if 'card_id' in payload:
         try:
             user = UserDAO.get(user_id)
+            payload['card_index'] = card_blind_index(payload['card_id'])
             payload['card_id'] = hash_card_id(payload['card_id'],
                                               user.salt.salt)
         except UserDAO.DoesNotExist:
@@ -138,6 +142,7 @@ def put_user(user_id: int, body: UserUpdate) -> UserOut:
         UserDAO.update(**payload).where(UserDAO.id == user_id).execute()
     except UserDAO.DoesNotExist:
         raise not_found
+    invalidate_user(user_id)
     return UserDAO[user_id]
 
 
@@ -152,6 +157,7 @@ def delete_user(user_id: int) -> Response:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="This user doesn't exist")
+    invalidate_user(user_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -174,6 +180,7 @@ def anonymize_user(user_id: int):
     user.group_year = None
     user.stats_agree = False
     user.save()
+    invalidate_user(user_id)
 
 
 @router.get('/card/', response_model=UserOut, dependencies=[Depends(get_db)])
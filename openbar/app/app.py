@@ -7,16 +7,16 @@ Main functions for the fastAPI app
 import os
 
 from fastapi import FastAPI
-from filelock import FileLock
 
 from apis import user, recharge, order
-from apis import auth, role
+from apis import auth, role, ledger
 
-from models.migration import migrate
-from tools.db import db, is_sqlite
-
-# Lock the db on table creation
-db_lock = FileLock("/tmp/db.lock")
+from models.ledger import snapshot_task
+from models.loginevent import login_history_task
+from models.migration import check_migration
+from models.order import order_events
+from models.user import last_login_task
+from tools.db import db
 
 
 def create_app():
@@ -29,19 +29,31 @@ def create_app():
     )
 
     app.include_router(auth.router)
+    app.include_router(ledger.router)
     app.include_router(order.router)
     app.include_router(recharge.router)
     app.include_router(role.router)
     app.include_router(user.router)
 
-    # Locking the db with a file to ensure other workers doesn't try to create the tables at the same time
-    with db_lock:
-        db.connect()
-        migrate()
-        if is_sqlite:
-            db.pragma('foreign_keys', 1, permanent=True)
+    # The database is migrated before the workers start, they only check its version
+    db.connect()
+    try:
+        check_migration()
+    finally:
         db.close()
 
+    background_tasks = [snapshot_task, login_history_task, last_login_task, order_events]
+
+    @app.on_event("startup")
+    def start_background_tasks():
+        for task in background_tasks:
+            task.start()
+
+    @app.on_event("shutdown")
+    def stop_background_tasks():
+        for task in background_tasks:
+            task.stop()
+
     secret_key = os.environ.get('SECRET_KEY', default="secretK")
 
     return app
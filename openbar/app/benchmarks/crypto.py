@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Timings of the cryptographic functions and of the card lookup
+    python -m benchmarks.crypto --repeat 50 --years 1 3 6 --users 100 1000 --csv crypto.csv
+It measures the argon2 hash and verify of tools.crypto with its parameters and with candidate ones,
+the encoding and decoding of the JWT, and search_user as a function of the number of yearly salts and of users,
+with and without the card blind index. The results are printed as tables and can be written to a CSV file.
+The DATABASE environment variable selects the database, a new SQLite file by default.
+The user and cardsalt tables are emptied, never use it on a real database.
+"""
+
+import argparse
+import csv
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+if 'DATABASE' not in os.environ:
+    # The database must be chosen before tools.db is imported
+    os.environ['DATABASE'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+
+"""Argon2 parameters compared to the ones of tools.crypto: (time_cost, memory_cost in KiB)"""
+ARGON2_CANDIDATES = [(1, 8), (2, 8), (1, 1024), (2, 19456), (3, 65536)]
+
+
+def measure(fn: Callable, repeat: int, prepare: Optional[Callable] = None) -> dict:
+    """Return the mean, median and 95th percentile of the time of fn in milliseconds
+    prepare(i) is called before each fn(i) and is not timed.
+    """
+    durations = []
+    for i in range(repeat):
+        if prepare is not None:
+            prepare(i)
+        start = time.perf_counter()
+        fn(i)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return {'mean': statistics.fmean(durations), 'p50': statistics.median(durations),
+            'p95': durations[min(len(durations) - 1, int(len(durations) * 0.95))]}
+
+
+def argon2_rows(repeat: int) -> List[dict]:
+    """Time the hash and the verify of tools.crypto, and of the candidate parameters"""
+    import argon2
+
+    from tools.crypto import generate_salt, hash_card_id, hash_password, verify_password
+
+    salt = generate_salt()
+    hashed = hash_password("password", salt)
+    rows = [
+        {'name': 'hash_password', 'params': 'tools.crypto', **measure(lambda i: hash_password(f"pw{i}", salt), repeat)},
+        {'name': 'hash_card_id', 'params': 'tools.crypto', **measure(lambda i: hash_card_id(f"card{i}", salt), repeat)},
+        {'name': 'verify_password', 'params': 'tools.crypto',
+         **measure(lambda i: verify_password(hashed, "password"), repeat)},
+    ]
+    for time_cost, memory_cost in ARGON2_CANDIDATES:
+        params = f"t={time_cost} m={memory_cost}KiB"
+
+        def hash_secret(i):
+            return argon2.low_level.hash_secret(f"pw{i}".encode(), salt.encode(), time_cost=time_cost,
+                                                memory_cost=memory_cost, parallelism=1, hash_len=64,
+                                                type=argon2.low_level.Type.ID)
+
+        candidate = hash_secret(0)
+        rows.append({'name': 'argon2 hash', 'params': params, **measure(hash_secret, repeat)})
+        rows.append({'name': 'argon2 verify', 'params': params,
+                     **measure(lambda i: argon2.low_level.verify_secret(candidate, b"pw0", argon2.low_level.Type.ID),
+                               repeat)})
+    return rows
+
+
+def jwt_rows(repeat: int) -> List[dict]:
+    """Time the encoding and the decoding of the tokens
+    The tokens have no permission: decode_user_token gives no audience to PyJWT, so it refuses the other ones.
+    """
+    from tools.crypto import decode_user_token, generate_user_token
+
+    token = generate_user_token(1, [])
+    return [
+        {'name': 'generate_user_token', 'params': 'HS512', **measure(lambda i: generate_user_token(i, []), repeat)},
+        {'name': 'decode_user_token', 'params': 'HS512', **measure(lambda i: decode_user_token(token), repeat)},
+    ]
+
+
+def seed_users(years: int, users: int) -> None:
+    """Replace the users and the salts by users spread over the given number of yearly salts"""
+    import peewee as pw
+
+    from models.cardsalt import CardSalt
+    from models.role import Role
+    from models.user import User
+    from tools.crypto import card_blind_index, generate_salt, hash_card_id
+    from tools.db import db
+
+    with db.atomic():
+        User.delete().execute()
+        CardSalt.delete().execute()
+        role, _ = Role.get_or_create(name="Benchmark")
+        salts = [CardSalt.create(year=2000 + i, salt=generate_salt()) for i in range(years)]
+        rows = []
+        for i in range(users):
+            salt = salts[i % years]
+            card_id = f"card-{i}"
+            rows.append(("First", f"User {i}", role.id, hash_card_id(card_id, salt.salt), card_blind_index(card_id),
+                         salt.year, salt.year))
+        fields = [User.first_name, User.name, User.role, User.card_id, User.card_index, User.salt, User.group_year]
+        for batch in pw.chunked(rows, 500):
+            User.insert_many(batch, fields=fields).execute()
+
+
+def search_rows(years_list: List[int], users_list: List[int], repeat: int) -> List[dict]:
+    """Time search_user for each number of salts and of users, with and without blind index"""
+    from models.user import User, search_user
+
+    rows = []
+    for years in years_list:
+        for users in users_list:
+            seed_users(years, users)
+            params = f"{years} years, {users} users"
+            rows.append({'name': 'search_user indexed', 'params': params,
+                         **measure(lambda i: search_user(f"card-{i * 7919 % users}"), repeat)})
+            rows.append({'name': 'search_user unknown card', 'params': params,
+                         **measure(lambda i: search_user(f"unknown-{i}"), repeat)})
+            # The users created before the blind index are found by hashing the card ID with every salt,
+            # search_user then fills their index so it is emptied again before each search
+            User.update(card_index=None).execute()
+            rows.append({'name': 'search_user without index', 'params': params,
+                         **measure(lambda i: search_user(f"card-{i * 7919 % users}"), repeat,
+                                   prepare=lambda i: User.update(card_index=None).execute())})
+            rows.append({'name': 'search_user unknown, no index', 'params': params,
+                         **measure(lambda i: search_user(f"unknown-{i}"), repeat)})
+    return rows
+
+
+def print_table(title: str, rows: List[dict]) -> None:
+    print(f"\n{title}")
+    print(f"  {'function':<32}{'parameters':<26}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for row in rows:
+        print(f"  {row['name']:<32}{row['params']:<26}{row['mean']:>10.3f}{row['p50']:>10.3f}{row['p95']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=50, help='number of runs of each measure')
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 3, 6], help='numbers of yearly salts')
+    parser.add_argument('--users', type=int, nargs='+', default=[100, 1000], help='numbers of users')
+    parser.add_argument('--csv', help='file receiving the results as CSV')
+    args = parser.parse_args()
+
+    from models.migration import migrate
+    from tools.db import db
+
+    db.connect()
+    try:
+        migrate()
+        sections = [
+            ('argon2', argon2_rows(args.repeat)),
+            ('jwt', jwt_rows(args.repeat)),
+            ('card lookup', search_rows(args.years, args.users, args.repeat)),
+        ]
+    finally:
+        db.close()
+
+    print(f"Database {os.environ['DATABASE']}, {args.repeat} runs of each measure")
+    for title, rows in sections:
+        print_table(title, rows)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as output:
+            writer = csv.DictWriter(output, fieldnames=['section', 'name', 'params', 'mean', 'p50', 'p95'])
+            writer.writeheader()
+            for title, rows in sections:
+                writer.writerows({'section': title, **row} for row in rows)
+
+
+if __name__ == '__main__':
+    main()
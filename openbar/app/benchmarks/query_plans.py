@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Query plans and timings of the frequent filters without and with the secondary indexes
+    python -m benchmarks.query_plans --users 5000
+The DATABASE environment variable selects the database, a new SQLite file by default.
+The tables are filled with fake data and the secondary indexes are dropped, never use it on a real database.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+if 'DATABASE' not in os.environ:
+    # The database must be chosen before tools.db is imported
+    os.environ['DATABASE'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+
+
+def seed(users: int) -> dict:
+    """Fill the database with fake users, orders, permissions and recharges
+    :return: the values searched by the queries
+    """
+    import peewee as pw
+
+    from models.cardsalt import CardSalt
+    from models.order import Order, OrderStatus
+    from models.permission import LoginType
+    from models.recharge import Recharge
+    from models.role import Role, RolePermission
+    from models.user import User, UserPermission
+    from tools.db import db
+
+    rng = random.Random(0)
+    years = list(range(2018, 2024))
+    with db.atomic():
+        CardSalt.insert_many([(year, f"{year:016d}") for year in years],
+                             fields=[CardSalt.year, CardSalt.salt]).execute()
+        roles = [Role.create(name=f"Role {i}").id for i in range(20)]
+        RolePermission.insert_many(
+            [(f"perm{i}", login_type.value, 0, role) for role in roles for i in range(30) for login_type in LoginType],
+            fields=[RolePermission.permission, RolePermission.login_type, RolePermission.range,
+                    RolePermission.role_id]).execute()
+        rows = []
+        for i in range(users):
+            year = rng.choice(years)
+            rows.append((f"First {i}", f"Name {i}", rng.choice(roles), f"{rng.getrandbits(128):032x}", year, year))
+        fields = [User.first_name, User.name, User.role, User.card_id, User.salt, User.group_year]
+        for batch in pw.chunked(rows, 500):
+            User.insert_many(batch, fields=fields).execute()
+        user_ids = [user_id for (user_id,) in User.select(User.id).tuples()]
+        statuses = [OrderStatus.FINISHED.value] * 8 + [OrderStatus.CANCELLED.value, OrderStatus.VALIDATED.value]
+        orders = [(user_id, rng.choice(statuses)) for user_id in user_ids for _ in range(10)]
+        orders += [(user_id, OrderStatus.IN_BASKET.value) for user_id in user_ids]
+        for batch in pw.chunked(orders, 500):
+            Order.insert_many(batch, fields=[Order.client, Order.status]).execute()
+        permissions = [(f"perm{i}", login_type.value, 0, user_id)
+                       for user_id in user_ids for i in range(2) for login_type in LoginType]
+        for batch in pw.chunked(permissions, 500):
+            UserPermission.insert_many(batch, fields=[UserPermission.permission, UserPermission.login_type,
+                                                      UserPermission.range, UserPermission.user_id]).execute()
+        recharges = [(user_ids[0], user_id, rng.randint(1, 5000)) for user_id in user_ids for _ in range(5)]
+        for batch in pw.chunked(recharges, 500):
+            Recharge.insert_many(batch, fields=[Recharge.barman, Recharge.client, Recharge.value]).execute()
+    user = User.get(User.id == rng.choice(user_ids))
+    return {'user': user, 'role': user.role_id, 'salts': years[-3:], 'card_id': user.card_id}
+
+
+def queries(values: dict) -> dict:
+    """Return the frequent queries of the API, built like the API builds them"""
+    import datetime
+
+    from models.order import Order, OrderStatus
+    from models.permission import LoginType
+    from models.recharge import Recharge
+    from models.role import RolePermission
+    from models.user import User, UserPermission
+
+    user = values['user']
+    return {
+        'basket of a user': Order.select()
+        .where((Order.client == user) & (Order.status == OrderStatus.IN_BASKET.value)),
+        'orders by status': Order.select()
+        .where(Order.status == OrderStatus.VALIDATED.value).order_by(Order.id).limit(100),
+        'user by card and salt': User.select()
+        .where(User.card_index.is_null() & User.salt.in_(values['salts']) & User.card_id.in_([values['card_id']]))
+        .order_by(User.salt.desc()).limit(1),
+        'permissions of a role': RolePermission.select(RolePermission.permission, RolePermission.range)
+        .where((RolePermission.role_id == values['role'])
+               & (RolePermission.login_type == LoginType.NORMAL_LOGIN.value)),
+        'permissions of a user': UserPermission.select(UserPermission.permission, UserPermission.range)
+        .where((UserPermission.user_id == user) & (UserPermission.login_type == LoginType.NORMAL_LOGIN.value)),
+        'recharges of a user': Recharge.select()
+        .where((Recharge.client == user) & (Recharge.created_at >= datetime.datetime(2000, 1, 1)))
+        .order_by(Recharge.id).limit(100),
+    }
+
+
+def explain(query) -> list[str]:
+    """Return the lines of the query plan"""
+    from tools.db import db, is_sqlite
+
+    sql, params = query.sql()
+    if is_sqlite:
+        return [row[3] for row in db.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    return [row[0] for row in db.execute_sql(f"EXPLAIN {sql}", params).fetchall()]
+
+
+def measure(query, repeat: int) -> float:
+    """Return the mean time of the query in milliseconds, without building the models"""
+    from tools.db import db
+
+    sql, params = query.sql()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        db.execute_sql(sql, params).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(values: dict, repeat: int) -> dict:
+    """Return the plan and time of each query"""
+    from tools.db import db
+
+    db.execute_sql("ANALYZE")
+    return {name: (explain(query), measure(query, repeat)) for name, query in queries(values).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000, help='number of fake users')
+    parser.add_argument('--repeat', type=int, default=200, help='number of runs of each query')
+    args = parser.parse_args()
+
+    from models.migration import migrate
+    from models.migration.secondary_indexes import secondary_indexes, create_secondary_indexes
+    from tools.db import db
+
+    db.connect()
+    migrate()
+    values = seed(args.users)
+    print(f"Database {os.environ['DATABASE']} with {args.users} users\n")
+
+    for index, _ in secondary_indexes():
+        db.execute_sql(f'DROP INDEX IF EXISTS "{index._name}"')
+    before = run(values, args.repeat)
+    create_secondary_indexes()
+    after = run(values, args.repeat)
+
+    for name, (plan, duration) in before.items():
+        print(f"== {name}")
+        print(f"  without the indexes: {duration:.3f} ms")
+        for line in plan:
+            print(f"    {line}")
+        plan, duration = after[name]
+        print(f"  with the indexes: {duration:.3f} ms")
+        for line in plan:
+            print(f"    {line}")
+        print()
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
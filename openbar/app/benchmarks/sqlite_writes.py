@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Throughput of concurrent writers on SQLite, with the default settings of SQLite and with the profile of tools.db
+    python -m benchmarks.sqlite_writes --processes 4 --threads 4 --writes 200
+Each process is a worker of the server: its threads run recharge-like transactions, reading a balance then
+updating it and inserting a row. Every profile is run on a new SQLite file.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+"""Settings of the profiles: environment of tools.db and transaction used by the writers"""
+PROFILES = {
+    'default': ({'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full', 'SQLITE_MMAP_SIZE': '0',
+                 'SQLITE_CACHE_SIZE': '2000'}, 'deferred'),
+    'wal': ({}, 'deferred'),
+    'wal + write_transaction': ({}, 'serialized'),
+}
+USERS = 100
+
+
+def seed(path: str, env: dict) -> None:
+    """Create the tables and the users in a new database"""
+    os.environ.update(env, DATABASE=f"sqlite:///{path}")
+    from models.cardsalt import CardSalt
+    from models.migration import migrate
+    from models.role import Role
+    from models.user import User
+    from tools.db import db
+
+    db.connect()
+    migrate()
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    User.insert_many([("First", f"Client {i}", role.id, str(i), salt.year, 2022, 0) for i in range(USERS)],
+                     fields=[User.first_name, User.name, User.role, User.card_id, User.salt, User.group_year,
+                             User.balance]).execute()
+    db.close()
+
+
+def writer(path: str, env: dict, transaction: str, threads: int, writes: int, start, results) -> None:
+    """Run the writes of one process and put its number of writes and of failures in results"""
+    import threading
+
+    import peewee as pw
+
+    os.environ.update(env, DATABASE=f"sqlite:///{path}")
+    from models.recharge import Recharge
+    from models.user import User
+    from tools.db import db, new_db_state, write_transaction
+
+    begin = write_transaction if transaction == 'serialized' else db.atomic
+    counts = {'writes': 0, 'failures': 0}
+    lock = threading.Lock()
+
+    def run():
+        new_db_state()
+        rng = random.Random()
+        done = failed = 0
+        for _ in range(writes):
+            user_id = rng.randint(1, USERS)
+            try:
+                with begin():
+                    balance = User.select(User.balance).where(User.id == user_id).scalar()
+                    User.update(balance=balance + 1).where(User.id == user_id).execute()
+                    Recharge.insert(barman=1, client=user_id, value=1).execute()
+                done += 1
+            except pw.OperationalError:
+                failed += 1
+        db.close()
+        with lock:
+            counts['writes'] += done
+            counts['failures'] += failed
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start.wait()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    results.put(counts)
+
+
+def run_profile(name: str, processes: int, threads: int, writes: int) -> dict:
+    """Run the writers of all the processes with a profile on a new database"""
+    env, transaction = PROFILES[name]
+    context = multiprocessing.get_context('spawn')
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    seeder = context.Process(target=seed, args=(path, env))
+    seeder.start()
+    seeder.join()
+    start = context.Barrier(processes + 1)
+    results = context.Queue()
+    workers = [context.Process(target=writer, args=(path, env, transaction, threads, writes, start, results))
+               for _ in range(processes)]
+    for process in workers:
+        process.start()
+    start.wait()
+    begin = time.perf_counter()
+    counts = [results.get() for _ in workers]
+    duration = time.perf_counter() - begin
+    for process in workers:
+        process.join()
+    done = sum(count['writes'] for count in counts)
+    return {'writes': done, 'failures': sum(count['failures'] for count in counts),
+            'duration': duration, 'throughput': done / duration}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4, help='number of writing processes')
+    parser.add_argument('--threads', type=int, default=4, help='number of writing threads in each process')
+    parser.add_argument('--writes', type=int, default=200, help='number of transactions of each thread')
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads x {args.writes} transactions")
+    print(f"{'profile':<26}{'committed':>10}{'failed':>8}{'seconds':>9}{'commits/s':>11}")
+    for name in PROFILES:
+        result = run_profile(name, args.processes, args.threads, args.writes)
+        print(f"{name:<26}{result['writes']:>10}{result['failures']:>8}{result['duration']:>9.2f}"
+              f"{result['throughput']:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time spent by a worker checking the database at startup
+    python -m benchmarks.startup --repeat 50
+It compares the reflection of the whole schema done before by migrate() in each worker
+to the migration check the workers do now, and gives the time of a full create_app().
+The DATABASE environment variable selects the database, a new SQLite file by default.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+if 'DATABASE' not in os.environ:
+    # The database must be chosen before tools.db is imported
+    os.environ['DATABASE'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+
+
+def measure(fn, repeat: int) -> float:
+    """Return the mean time of fn in milliseconds, each run with a new connection"""
+    from tools.db import db
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        db.connect()
+        try:
+            fn()
+        finally:
+            db.close()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=50, help='number of runs of each step')
+    args = parser.parse_args()
+
+    from playhouse.reflection import generate_models
+
+    from app import create_app
+    from models.migration import migrate, check_migration
+    from tools.db import db
+
+    db.connect()
+    migrate()
+    db.close()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        create_app()
+    create_app_time = (time.perf_counter() - start) / args.repeat * 1000
+
+    print(f"Database {os.environ['DATABASE']}, mean of {args.repeat} runs")
+    for name, duration in [
+        ("reflection of the schema (before, in each worker)", measure(lambda: generate_models(db), args.repeat)),
+        ("migrate() on an up-to-date database (now, once)", measure(migrate, args.repeat)),
+        ("check_migration() (now, in each worker)", measure(check_migration, args.repeat)),
+        ("whole create_app() (now, in each worker)", create_app_time),
+    ]:
+        print(f"  {name:<52}{duration:8.3f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Command line tools of the server
+    python cli.py migrate
+"""
+
+import argparse
+import logging
+import sys
+
+log = logging.getLogger(__name__)
+
+
+def migrate_database() -> None:
+    """Migrate the database to the latest version"""
+    from models.migration import migrate, LATEST_MIGRATION
+    from tools.db import db
+
+    db.connect()
+    try:
+        migrate()
+    finally:
+        db.close()
+    log.info("The database is at the migration %s", LATEST_MIGRATION)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tools of the OpenBar server")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help=migrate_database.__doc__)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'migrate':
+        migrate_database()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
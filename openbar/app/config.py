@@ -6,8 +6,68 @@
 Global configuration
 """
 
+import os
+
 """Name of the issuer given in the iss field of the token"""
 ISSUER_NAME = "OpenBar Auth"
 
 """Validity time of tokens."""
 TOKEN_VALIDITY_TIME = 3000
+
+"""Number of threads hashing a card ID with the yearly salts at the same time."""
+CARD_SEARCH_WORKERS = int(os.environ.get('CARD_SEARCH_WORKERS', default=min(8, os.cpu_count() or 1)))
+
+"""Number of threads per worker running the blocking work of the authentication (argon2 and database)."""
+CRYPTO_WORKERS = int(os.environ.get('CRYPTO_WORKERS', default=os.cpu_count() or 1))
+
+"""Maximum number of verified tokens kept in memory by each worker."""
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', default=1024))
+
+"""Maximum time in seconds a verified token is kept in memory.
+Users updated by another worker may be seen with their old values during this time."""
+TOKEN_CACHE_MAX_AGE = int(os.environ.get('TOKEN_CACHE_MAX_AGE', default=60))
+
+"""Time in seconds a successful HTTP Basic authentication is kept in memory, 0 disables the cache.
+Only the first request of each period pays the cost of the password hash.
+The cache of a worker is only cleared by the changes it makes: after a password change or a deletion handled by
+another worker, the old credentials are still accepted by this one during this time."""
+BASIC_AUTH_CACHE_TTL = int(os.environ.get('BASIC_AUTH_CACHE_TTL', default=0))
+
+"""Maximum number of HTTP Basic authentications kept in memory by each worker."""
+BASIC_AUTH_CACHE_SIZE = int(os.environ.get('BASIC_AUTH_CACHE_SIZE', default=256))
+
+"""Minimum time in seconds between two checks of the version of the data cached by a worker
+(role permissions and role tree)."""
+CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', default=5))
+
+"""Number of objects returned by the list endpoints when no limit is given."""
+DEFAULT_PAGE_SIZE = 100
+
+"""Maximum number of objects returned by a list endpoint."""
+MAX_PAGE_SIZE = 1000
+
+"""Time in seconds between two snapshots of the balances taken by each worker, 0 disables them."""
+LEDGER_SNAPSHOT_INTERVAL = float(os.environ.get('LEDGER_SNAPSHOT_INTERVAL', default=3600))
+
+"""Maximum number of logins kept in memory by each worker before they are written to the database.
+The oldest ones are lost when it is full."""
+LOGIN_HISTORY_BUFFER_SIZE = int(os.environ.get('LOGIN_HISTORY_BUFFER_SIZE', default=10000))
+
+"""Time in seconds between two writes of the logins kept in memory to the database."""
+LOGIN_HISTORY_FLUSH_INTERVAL = float(os.environ.get('LOGIN_HISTORY_FLUSH_INTERVAL', default=5))
+
+"""Time in seconds between two writes of the last login dates kept in memory to the database."""
+LAST_LOGIN_FLUSH_INTERVAL = float(os.environ.get('LAST_LOGIN_FLUSH_INTERVAL', default=5))
+
+"""Maximum time in seconds between two reads of the new order events by each worker when the database is SQLite.
+With PostgreSQL they are pushed by notifications."""
+ORDER_EVENTS_POLL_INTERVAL = float(os.environ.get('ORDER_EVENTS_POLL_INTERVAL', default=1))
+
+"""Time in seconds without order event after which a comment is sent to keep the event streams open."""
+ORDER_EVENTS_HEARTBEAT = float(os.environ.get('ORDER_EVENTS_HEARTBEAT', default=15))
+
+"""Number of order events waiting to be sent to a client before it is disconnected."""
+ORDER_EVENTS_QUEUE_SIZE = int(os.environ.get('ORDER_EVENTS_QUEUE_SIZE', default=100))
+
+"""Maximum time in seconds a node waits for the migration run by another one before giving up."""
+MIGRATION_LOCK_TIMEOUT = float(os.environ.get('MIGRATION_LOCK_TIMEOUT', default=300))
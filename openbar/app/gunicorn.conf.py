@@ -8,6 +8,8 @@ Gunicorn conf file
 import os
 import multiprocessing
 import signal
+import subprocess
+import sys
 
 
 def worker_int(worker):
@@ -29,3 +31,16 @@ worker_class = "uvicorn.workers.UvicornWorker"
 loglevel = 'info'
 if os.environ.get('ENV', default=None) in ('development', 'test'):
     loglevel = 'debug'
+
+
+def on_starting(server):
+    """
+    Migrate the database once, before the workers start
+    It runs in its own process, so the master doesn't keep database connections that the workers would inherit.
+    """
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(__file__), 'cli.py'), 'migrate'], check=True)
+
+
+def on_reload(server):
+    """Migrate the database before the workers are restarted by a HUP signal"""
+    on_starting(server)
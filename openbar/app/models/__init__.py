@@ -9,8 +9,11 @@ Initialisation of models
 def create_tables():
     """Create tables for all models"""
     from models.migration.MigrationHistory import MigrationHistory
+    from models.cacheversion import CacheVersion
     from models.cardsalt import CardSalt
-    from models.order import Order, OrderProduct
+    from models.ledger import BalanceMovement, BalanceSnapshot
+    from models.loginevent import LoginEvent
+    from models.order import Order, OrderProduct, OrderEvent
     from models.permission import Permission
     from models.recharge import Recharge
     from models.role import Role, RolePermission
@@ -18,4 +21,5 @@ def create_tables():
     from tools.db import db
     db.create_tables([User, Role, CardSalt, Recharge, Order,
                       OrderProduct, Permission, RolePermission,
-                      UserPermission, MigrationHistory])
+                      UserPermission, MigrationHistory, CacheVersion,
+                      BalanceMovement, BalanceSnapshot, LoginEvent, OrderEvent])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Definition of the CacheVersion model
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import peewee as pw
+
+from tools.db import db
+
+
+class CacheVersion(pw.Model):
+    """
+    Version counter of a data cached in memory by the workers.
+    A worker changing the data increments the counter, the other workers see it and drop their cache.
+    """
+    name = pw.CharField(primary_key=True)
+    version = pw.IntegerField(default=0)
+
+    class Meta:
+        database = db
+        table_name = 'cache_version'
+
+
+def get_version(name: str) -> int:
+    """Return the current version of a cached data"""
+    version = CacheVersion.select(CacheVersion.version).where(CacheVersion.name == name).scalar()
+    return 0 if version is None else version
+
+
+def bump_version(name: str) -> None:
+    """Increment the version of a cached data"""
+    CacheVersion.insert(name=name, version=1)\
+        .on_conflict(conflict_target=[CacheVersion.name],
+                     update={CacheVersion.version: CacheVersion.version + 1})\
+        .execute()
+
+
+class VersionedCache(ABC):
+    """
+    Base of the data kept in memory by each worker, with a version counter shared in the database.
+    The worker changing the data increments the counter, then the other workers see it and drop their cache.
+    The counter is read at most once every check_interval seconds.
+    Subclasses implement _clear() and call check_version() before reading their data.
+    """
+
+    def __init__(self, name: str, check_interval: float):
+        self.name = name
+        self.check_interval = check_interval
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _clear(self) -> None:
+        """Drop the cached data, called with the lock held"""
+
+    def check_version(self, fresh: bool = False) -> int:
+        """Drop the cached data if its version changed and return the version of the cached data
+        fresh reads the version even if it was read less than check_interval ago.
+        """
+        now = time.monotonic()
+        if not fresh and self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._version
+        version = get_version(self.name)
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                self._clear()
+                self._version = version
+            return version
+
+    def invalidate(self) -> None:
+        """Drop the data cached by every worker, after the data was changed"""
+        bump_version(self.name)
+        with self._lock:
+            self._clear()
+            self._checked_at = None
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Definition of the balance ledger models
+Each change of a balance is appended as a movement, the movements are never updated.
+The snapshots give the balance of the users up to a movement, so the history doesn't have to be read from the start.
+"""
+
+import datetime
+import logging
+from typing import List, Optional, Tuple
+
+import peewee as pw
+
+from config import LEDGER_SNAPSHOT_INTERVAL
+from models.order import Order
+from models.recharge import Recharge
+from models.user import User
+from tools.background import PeriodicTask
+from tools.db import db, is_sqlite, write_transaction
+
+log = logging.getLogger(__name__)
+
+
+class BalanceMovement(pw.Model):
+    """Model to describe a change of the balance of a user"""
+    id = pw.AutoField()
+    user = pw.ForeignKeyField(User, backref="movements")
+    amount = pw.IntegerField()
+    recharge = pw.ForeignKeyField(Recharge, null=True)
+    order = pw.ForeignKeyField(Order, null=True)
+    created_at = pw.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        database = db
+        table_name = 'balance_movement'
+        indexes = (
+            (('user', 'created_at'), False),
+        )
+
+
+class BalanceSnapshot(pw.Model):
+    """
+    Model to describe the balance of a user at a date, it is the sum of its movements up to last_movement_id.
+    They were all made before taken_at, the later movements all have a greater id.
+    """
+    id = pw.AutoField()
+    user = pw.ForeignKeyField(User, backref="snapshots")
+    taken_at = pw.DateTimeField()
+    balance = pw.IntegerField()
+    last_movement_id = pw.IntegerField(default=0)
+
+    class Meta:
+        database = db
+        table_name = 'balance_snapshot'
+        indexes = (
+            (('user', 'taken_at'), True),
+        )
+
+
+def record_movement(user_id: int, amount: int, recharge: Optional[Recharge] = None,
+                    order: Optional[Order] = None) -> None:
+    """
+    Append a movement to the ledger
+    It must be called in the transaction changing the balance.
+    :param user_id: id of the user whose balance changed
+    :param amount: signed change of the balance
+    :param recharge: recharge behind the movement
+    :param order: order behind the movement
+    """
+    if amount == 0:
+        return
+    BalanceMovement.insert(user=user_id, amount=amount, recharge=recharge, order=order).execute()
+
+
+def record_recharges(recharges: List[Recharge]) -> None:
+    """
+    Append the movements of the recharges to the ledger with batched inserts
+    It must be called in the transaction changing the balances.
+    :param recharges: created recharges
+    """
+    rows = [(recharge.client_id, recharge.value, recharge.id, recharge.created_at) for recharge in recharges
+            if recharge.value != 0]
+    fields = [BalanceMovement.user, BalanceMovement.amount, BalanceMovement.recharge, BalanceMovement.created_at]
+    for batch in pw.chunked(rows, 500):
+        BalanceMovement.insert_many(batch, fields=fields).execute()
+
+
+def latest_snapshot(user_id: int, date: datetime.datetime) -> Optional[BalanceSnapshot]:
+    """Return the last snapshot of the user taken before the date"""
+    return BalanceSnapshot.select()\
+        .where((BalanceSnapshot.user == user_id) & (BalanceSnapshot.taken_at <= date))\
+        .order_by(BalanceSnapshot.taken_at.desc())\
+        .first()
+
+
+def balance_at(user_id: int, date: datetime.datetime) -> int:
+    """
+    Return the balance of the user at the date
+    It is the last snapshot before the date plus the later movements made until the date.
+    :param user_id: id of the user
+    :param date: date of the balance
+    :return: the balance
+    """
+    snapshot = latest_snapshot(user_id, date)
+    tail = BalanceMovement.select(pw.fn.COALESCE(pw.fn.SUM(BalanceMovement.amount), 0))\
+        .where((BalanceMovement.user == user_id) & (BalanceMovement.created_at <= date))
+    if snapshot is None:
+        return tail.scalar()
+    return snapshot.balance + tail.where(BalanceMovement.id > snapshot.last_movement_id).scalar()
+
+
+def statement(user_id: int, start: datetime.datetime, end: datetime.datetime) \
+        -> Tuple[int, List[BalanceMovement]]:
+    """
+    Return the statement of the balance of the user between two dates
+    :param user_id: id of the user
+    :param start: the movements made after this date are given
+    :param end: the movements made until this date are given
+    :return: the balance at the start and the movements, in the order they were made
+    """
+    movements = BalanceMovement.select()\
+        .where((BalanceMovement.user == user_id)
+               & (BalanceMovement.created_at > start) & (BalanceMovement.created_at <= end))\
+        .order_by(BalanceMovement.created_at, BalanceMovement.id)
+    return balance_at(user_id, start), list(movements)
+
+
+def take_snapshots(taken_at: Optional[datetime.datetime] = None) -> int:
+    """
+    Snapshot the balance of every user with movements since its last snapshot
+    The new snapshots are computed from the previous ones in one INSERT ... SELECT. They end at the last movement,
+    by id and not by date: a movement committed after a snapshot always has a greater id, so it is in the next one.
+    :param taken_at: date of the snapshots, now by default. It must be later than the movements already written.
+    :return: the number of snapshots taken
+    """
+    with write_transaction():
+        if not is_sqlite:
+            # The ids are given before the commits, the transactions inserting movements are waited for
+            db.execute_sql(f'LOCK TABLE "{BalanceMovement._meta.table_name}" IN SHARE MODE')
+        if taken_at is None:
+            taken_at = datetime.datetime.now()
+        last_movement_id = BalanceMovement.select(pw.fn.MAX(BalanceMovement.id)).scalar()
+        if last_movement_id is None:
+            return 0
+        last_ids = BalanceSnapshot\
+            .select(BalanceSnapshot.user, pw.fn.MAX(BalanceSnapshot.last_movement_id).alias('last_movement_id'))\
+            .group_by(BalanceSnapshot.user)\
+            .alias('last_ids')
+        last = BalanceSnapshot.alias('last')
+        query = BalanceMovement.select(BalanceMovement.user, pw.Value(taken_at),
+                                       pw.fn.COALESCE(last.balance, 0) + pw.fn.SUM(BalanceMovement.amount),
+                                       pw.Value(last_movement_id))\
+            .join(last_ids, pw.JOIN.LEFT_OUTER, on=(last_ids.c.user_id == BalanceMovement.user))\
+            .join(last, pw.JOIN.LEFT_OUTER, on=((last.user == last_ids.c.user_id)
+                                                & (last.last_movement_id == last_ids.c.last_movement_id)))\
+            .where((BalanceMovement.id <= last_movement_id)
+                   & ((last_ids.c.last_movement_id.is_null())
+                      | (BalanceMovement.id > last_ids.c.last_movement_id)))\
+            .group_by(BalanceMovement.user, last.balance)
+        count = BalanceSnapshot.insert_from(query, [BalanceSnapshot.user, BalanceSnapshot.taken_at,
+                                                    BalanceSnapshot.balance, BalanceSnapshot.last_movement_id])\
+            .on_conflict_ignore()\
+            .as_rowcount()\
+            .execute()
+    log.info("%s balance snapshots taken at %s", count, taken_at)
+    return count
+
+
+def check_balances() -> List[Tuple[int, int, int]]:
+    """
+    Compare the balance of each user to the sum of its movements
+    :return: (user id, balance, sum of the movements) of each user whose balance doesn't match the ledger
+    """
+    movements = BalanceMovement.select(BalanceMovement.user, pw.fn.SUM(BalanceMovement.amount).alias('total'))\
+        .group_by(BalanceMovement.user)\
+        .alias('movements')
+    total = pw.fn.COALESCE(movements.c.total, 0)
+    return list(User.select(User.id, User.balance, total)
+                .join(movements, pw.JOIN.LEFT_OUTER, on=(movements.c.user_id == User.id))
+                .where(User.balance != total)
+                .order_by(User.id)
+                .tuples())
+
+
+"""Task of each worker taking the snapshots"""
+snapshot_task = PeriodicTask('ledger-snapshots', LEDGER_SNAPSHOT_INTERVAL, take_snapshots)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Definition of the login history
+The logins are kept in memory by each worker and written to the database in batches.
+"""
+
+import datetime
+import logging
+import threading
+from collections import deque
+from typing import List
+
+import peewee as pw
+
+from config import LOGIN_HISTORY_BUFFER_SIZE, LOGIN_HISTORY_FLUSH_INTERVAL
+from models.user import User
+from tools.background import PeriodicTask
+from tools.db import db, write_transaction
+
+log = logging.getLogger(__name__)
+
+
+class LoginEvent(pw.Model):
+    """Model to describe a login attempt of a user"""
+    id = pw.AutoField()
+    user = pw.ForeignKeyField(User, backref="login_events", on_delete='CASCADE')
+    created_at = pw.DateTimeField(default=datetime.datetime.now, index=True)
+    succeeded = pw.BooleanField()
+    partial = pw.BooleanField(default=False)
+
+    class Meta:
+        database = db
+        table_name = 'login_event'
+        indexes = (
+            (('user', 'created_at'), False),
+        )
+
+
+"""Columns of the logins kept in the buffer"""
+EVENT_FIELDS = [LoginEvent.user, LoginEvent.created_at, LoginEvent.succeeded, LoginEvent.partial]
+
+
+class LoginHistory:
+    """Fixed-size buffer of the logins of the worker, written to the database by flush"""
+
+    def __init__(self, size: int):
+        self._events = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def record(self, user_id: int, succeeded: bool, partial: bool = False) -> None:
+        """
+        Add a login to the buffer, it doesn't touch the database
+        :param user_id: id of the user trying to login
+        :param succeeded: whether the user was authenticated
+        :param partial: whether it was a login with the card only
+        """
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append((user_id, datetime.datetime.now(), succeeded, partial))
+
+    def flush(self) -> int:
+        """
+        Write the logins of the buffer to the database with batched inserts
+        The logins which can't be written, for example because their user was deleted, are logged and dropped.
+        If the database can't be reached, the logins not written are put back in the buffer, as long as they fit.
+        :return: the number of logins written
+        """
+        with self._lock:
+            events = []
+            while True:
+                try:
+                    events.append(self._events.popleft())
+                except IndexError:
+                    break
+            if self.dropped:
+                log.warning("%s logins were lost, the history buffer was full", self.dropped)
+                self.dropped = 0
+            written = 0
+            done = 0
+            try:
+                for batch in pw.chunked(events, 500):
+                    written += self._write(batch)
+                    done += len(batch)
+            except Exception:
+                self._put_back(events[done:])
+                raise
+            return written
+
+    def _write(self, batch: List[tuple]) -> int:
+        """Insert a batch of logins, one at a time when one of them is refused, and return the number written"""
+        try:
+            with write_transaction():
+                LoginEvent.insert_many(batch, fields=EVENT_FIELDS).execute()
+            return len(batch)
+        except pw.IntegrityError:
+            pass
+        written = 0
+        for event in batch:
+            try:
+                with write_transaction():
+                    LoginEvent.insert_many([event], fields=EVENT_FIELDS).execute()
+                written += 1
+            except pw.IntegrityError as error:
+                log.warning("The login of the user %s at %s is dropped: %s", event[0], event[1], error)
+        return written
+
+    def _put_back(self, events: List[tuple]) -> None:
+        """Put logins not written back at the start of the buffer, the oldest are dropped if they don't fit"""
+        free = self._events.maxlen - len(self._events)
+        kept = events[max(0, len(events) - free):]
+        self.dropped += len(events) - len(kept)
+        self._events.extendleft(reversed(kept))
+
+
+login_history = LoginHistory(LOGIN_HISTORY_BUFFER_SIZE)
+
+"""Task of each worker writing its logins to the database, and the last ones when it stops"""
+login_history_task = PeriodicTask('login-history', LOGIN_HISTORY_FLUSH_INTERVAL, login_history.flush,
+                                  run_on_stop=True)
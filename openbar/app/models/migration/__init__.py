@@ -3,33 +3,158 @@
 
 """
 Migration of database
+The migrations are run once before the workers start, by the gunicorn master or with `python cli.py migrate`.
+The workers only check that the database is at the latest migration.
 """
 
-from playhouse.reflection import generate_models
+import logging
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Optional
 
-from tools.db import db
+import peewee as pw
 
+from config import MIGRATION_LOCK_TIMEOUT
+from models.migration.MigrationHistory import MigrationHistory
+from models.migration.balance_ledger import create_balance_ledger
+from models.migration.cache_version import create_cache_version
+from models.migration.login_event import create_login_event
+from models.migration.login_event_cascade import cascade_login_event
+from models.migration.order_event import create_order_event
+from models.migration.order_totals import add_order_totals
+from models.migration.secondary_indexes import create_secondary_indexes
+from models.migration.snapshot_movement import add_snapshot_movement
+from models.migration.user_card_index import add_user_card_index
+from tools.db import db, is_sqlite
 
-def migrate():
-    """Migrate to the latest version of the database"""
-    from models.migration.MigrationHistory import MigrationHistory
+log = logging.getLogger(__name__)
+
+__all_migrations__ = [
+    ('0001_user_card_index', add_user_card_index),
+    ('0002_cache_version', create_cache_version),
+    ('0003_order_totals', add_order_totals),
+    ('0004_balance_ledger', create_balance_ledger),
+    ('0005_login_event', create_login_event),
+    ('0006_order_event', create_order_event),
+    ('0007_secondary_indexes', create_secondary_indexes),
+    ('0008_login_event_cascade', cascade_login_event),
+    ('0009_snapshot_movement', add_snapshot_movement),
+]
+
+"""Name of the migration the code expects the database to be at"""
+LATEST_MIGRATION = __all_migrations__[-1][0]
+
+"""Key of the PostgreSQL advisory lock taken during the migrations"""
+MIGRATION_LOCK_KEY = zlib.crc32(b'openbar migration')
 
-    __all_migrations__ = []
 
-    models = generate_models(db)
-    keys = models.keys()
+def _try_lock() -> Optional[pw._atomic]:
+    """Try to take the migration lock once
+    :return: with SQLite, the exclusive transaction holding the lock, else None
+    :raise pw.OperationalError: if the lock is held by another process
+    """
+    if is_sqlite:
+        transaction = db.atomic('EXCLUSIVE')
+        transaction.__enter__()
+        return transaction
+    if not db.execute_sql("SELECT pg_try_advisory_lock(%s)", (MIGRATION_LOCK_KEY,)).fetchone()[0]:
+        raise pw.OperationalError("The migration lock is held by another node")
+    return None
 
-    if 'user' not in keys:
+
+@contextmanager
+def migration_lock(timeout: float = MIGRATION_LOCK_TIMEOUT):
+    """Run the block while no other node migrates the same database
+    With PostgreSQL, it is a session advisory lock.
+    With SQLite, it is an exclusive transaction, so the migrations are also applied all or nothing.
+    :param timeout: maximum time in seconds to wait for the other nodes
+    :raise TimeoutError: if the lock is still held by another node after timeout seconds
+    """
+    start = time.monotonic()
+    while True:
+        try:
+            transaction = _try_lock()
+            break
+        except pw.OperationalError:
+            waited = time.monotonic() - start
+            if waited >= timeout:
+                raise TimeoutError(f"The migration lock is still held by another node after {waited:.0f} seconds")
+            log.info("Waiting for another node to finish migrating the database (%.0fs)", waited)
+            time.sleep(min(1.0, timeout - waited))
+    log.info("Migration lock taken after %.1fs", time.monotonic() - start)
+    try:
+        yield
+    except BaseException as error:
+        if transaction is not None:
+            transaction.__exit__(type(error), error, error.__traceback__)
+        raise
+    else:
+        if transaction is not None:
+            transaction.__exit__(None, None, None)
+    finally:
+        if transaction is None:
+            db.execute_sql("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        log.info("Migration lock released")
+
+
+def migrate():
+    """Migrate to the latest version of the database
+    Several nodes can call it at the same time, the migrations are applied by the first one and skipped by the others.
+    With SQLite, the foreign keys are disabled during the migrations: peewee rebuilds a table to change its columns,
+    and dropping the old table would delete the rows referencing it. They are checked before the commit instead.
+    """
+    if not is_sqlite:
+        with migration_lock():
+            _migrate()
+        return
+    # The pragma has no effect inside a transaction, so it is set before the lock is taken
+    db.pragma('foreign_keys', 0)
+    try:
+        with migration_lock():
+            _migrate()
+            violations = db.execute_sql('PRAGMA foreign_key_check').fetchall()
+            if violations:
+                raise RuntimeError(f"The migrations broke {len(violations)} foreign keys, "
+                                   f"the first one is {violations[0]}")
+    finally:
+        db.pragma('foreign_keys', 1)
+
+
+def _migrate():
+    if not db.table_exists('user'):
         # We suppose the database is empty
         from models import create_tables
+        log.info("Creating the tables of an empty database")
         create_tables()
-        for name, _ in __all_migrations__:
-            MigrationHistory.create(name=name)
+        MigrationHistory.insert_many([(name,) for name, _ in __all_migrations__],
+                                     fields=[MigrationHistory.name]).execute()
         return
-    if 'migration_history' not in keys:
+    if not db.table_exists(MigrationHistory._meta.table_name):
         db.create_tables([MigrationHistory])
+    applied = {name for (name,) in MigrationHistory.select(MigrationHistory.name).tuples()}
     for name, migrate_fn in __all_migrations__:
-        if MigrationHistory.get_or_none(name=name) is not None:
+        if name in applied:
             continue
+        log.info("Applying the migration %s", name)
         migrate_fn()
         MigrationHistory.create(name=name)
+
+
+def current_migration() -> Optional[str]:
+    """Return the name of the last migration applied to the database, None if there is none"""
+    try:
+        with db.atomic():
+            return MigrationHistory.select(pw.fn.MAX(MigrationHistory.name)).scalar()
+    except pw.DatabaseError:
+        return None
+
+
+def check_migration():
+    """Check that the database is at the migration expected by the code, with a single-row read
+    :raise RuntimeError: if the database must be migrated, or if the code is older than the database
+    """
+    current = current_migration()
+    if current != LATEST_MIGRATION:
+        raise RuntimeError(f"The database is at the migration {current or 'none'} "
+                           f"but the server expects {LATEST_MIGRATION}. Run `python cli.py migrate` first.")
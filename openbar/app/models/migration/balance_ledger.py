@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration creating the balance ledger
+"""
+
+import datetime
+
+import peewee as pw
+
+from tools.db import db
+
+
+def create_balance_ledger():
+    """Create the ledger tables
+    Each user with money gets an opening movement of its current balance, so the balances match the ledger.
+    """
+    from models.ledger import BalanceMovement, BalanceSnapshot
+    from models.user import User
+
+    with db.atomic():
+        db.create_tables([BalanceMovement, BalanceSnapshot])
+        opening = User.select(User.id, User.balance, pw.Value(datetime.datetime.now())).where(User.balance != 0)
+        BalanceMovement.insert_from(opening, [BalanceMovement.user, BalanceMovement.amount,
+                                              BalanceMovement.created_at]).execute()
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration adding the version counters of the cached data
+"""
+
+from tools.db import db
+
+
+def create_cache_version():
+    """Create the cache_version table"""
+    from models.cacheversion import CacheVersion
+
+    db.create_tables([CacheVersion])
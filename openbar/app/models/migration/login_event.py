@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration creating the login history table
+"""
+
+from tools.db import db
+
+
+def create_login_event():
+    """Create the login_event table"""
+    from models.loginevent import LoginEvent
+
+    db.create_tables([LoginEvent])
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration deleting the login history of a user with the user
+"""
+
+from tools.db import db, is_sqlite
+
+
+def cascade_login_event():
+    """Make the foreign key of login_event to the user table cascade on delete
+    SQLite can't change a constraint, so the table is rebuilt. The logins of users already deleted are dropped.
+    """
+    from models.loginevent import LoginEvent
+
+    with db.atomic():
+        if not is_sqlite:
+            db.execute_sql('ALTER TABLE login_event DROP CONSTRAINT login_event_user_id_fkey, '
+                           'ADD CONSTRAINT login_event_user_id_fkey FOREIGN KEY (user_id) '
+                           'REFERENCES "user" (id) ON DELETE CASCADE')
+            return
+        db.execute_sql('ALTER TABLE login_event RENAME TO login_event_old')
+        for index in db.get_indexes('login_event_old'):
+            db.execute_sql(f'DROP INDEX "{index.name}"')
+        db.create_tables([LoginEvent])
+        db.execute_sql('INSERT INTO login_event (id, user_id, created_at, succeeded, partial) '
+                       'SELECT id, user_id, created_at, succeeded, partial FROM login_event_old '
+                       'WHERE user_id IN (SELECT id FROM "user")')
+        db.execute_sql('DROP TABLE login_event_old')
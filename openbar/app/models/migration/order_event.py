@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration creating the order events table
+"""
+
+from tools.db import db
+
+
+def create_order_event():
+    """Create the order_event table"""
+    from models.order import OrderEvent
+
+    db.create_tables([OrderEvent])
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration adding the stored totals to orders
+"""
+
+from playhouse.migrate import SchemaMigrator, migrate as run_operations
+
+from tools.db import db
+
+
+def add_order_totals():
+    """Add the total and item_count columns to the order table and compute them from the products"""
+    from models.order import Order, check_order_totals
+
+    migrator = SchemaMigrator.from_database(db)
+    with db.atomic():
+        run_operations(migrator.add_column(Order._meta.table_name, 'total', Order.total),
+                       migrator.add_column(Order._meta.table_name, 'item_count', Order.item_count))
+        check_order_totals(fix=True)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration adding the indexes of the frequent filters
+"""
+
+from typing import List, Tuple
+
+import peewee as pw
+
+from tools.db import db
+
+
+def secondary_indexes() -> List[Tuple[pw.ModelIndex, List[str]]]:
+    """Return the indexes declared by the models for the frequent filters, with the columns they must have"""
+    from models.order import Order
+    from models.recharge import Recharge
+    from models.role import RolePermission
+    from models.user import User, UserPermission
+
+    fields = [
+        (Order, [Order.client, Order.status]),
+        (Order, [Order.status]),
+        (User, [User.salt, User.card_id]),
+        (RolePermission, [RolePermission.role_id, RolePermission.login_type]),
+        (UserPermission, [UserPermission.user_id, UserPermission.login_type]),
+        (Recharge, [Recharge.client, Recharge.created_at]),
+    ]
+    return [(model.index(*index_fields), [field.column_name for field in index_fields])
+            for model, index_fields in fields]
+
+
+def verify_indexes(indexes: List[Tuple[pw.ModelIndex, List[str]]]) -> None:
+    """Check that the indexes exist in the database with the right columns
+    :raise RuntimeError: if one of them is missing or different
+    """
+    for index, columns in indexes:
+        table = index._table.__name__
+        existing = {metadata.name: metadata.columns for metadata in db.get_indexes(table)}
+        if existing.get(index._name) != columns:
+            raise RuntimeError(f"The index {index._name} on {table}({', '.join(columns)}) "
+                               f"was not created, found {existing.get(index._name)}")
+
+
+def create_secondary_indexes():
+    """Create the indexes of the frequent filters if they don't exist yet, then check them"""
+    indexes = secondary_indexes()
+    with db.atomic():
+        for index, _ in indexes:
+            db.execute(index)
+    verify_indexes(indexes)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration ending the balance snapshots at a movement instead of a date
+"""
+
+from playhouse.migrate import SchemaMigrator, migrate as run_operations
+
+from tools.db import db
+
+
+def add_snapshot_movement():
+    """Add the id of the last movement included to the balance snapshots
+    The snapshots taken by date can miss the movements committed late, they are deleted and taken again by the workers.
+    The column already exists when the ledger was created by this version.
+    """
+    from models.ledger import BalanceSnapshot
+
+    table = BalanceSnapshot._meta.table_name
+    with db.atomic():
+        BalanceSnapshot.delete().execute()
+        if 'last_movement_id' not in {column.name for column in db.get_columns(table)}:
+            migrator = SchemaMigrator.from_database(db)
+            run_operations(migrator.add_column(table, 'last_movement_id', BalanceSnapshot.last_movement_id))
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Migration adding the card blind index to users
+"""
+
+from playhouse.migrate import SchemaMigrator, migrate as run_operations
+
+from tools.db import db
+
+
+def add_user_card_index():
+    """Add the indexed card_index column to the user table
+    It is left empty, search_user fills it the first time each user logs in with its card.
+    """
+    from models.user import User
+
+    migrator = SchemaMigrator.from_database(db)
+    with db.atomic():
+        run_operations(migrator.add_column(User._meta.table_name, 'card_index', User.card_index))
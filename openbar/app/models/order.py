@@ -6,13 +6,16 @@ Definition of Oder models
 """
 import datetime
 from enum import Enum
+from typing import Dict, List, Optional, Tuple
 
 import peewee as pw
 from fastapi import HTTPException
 from starlette import status
 
+from config import ORDER_EVENTS_POLL_INTERVAL, ORDER_EVENTS_QUEUE_SIZE
 from models.user import User
-from tools.db import db
+from tools.db import db, write_transaction
+from tools.events import EventBroadcaster
 
 
 class OrderStatus(Enum):
@@ -30,13 +33,19 @@ class Order(pw.Model):
     id = pw.AutoField()
     client = pw.ForeignKeyField(User, backref="orders")
     barman = pw.ForeignKeyField(User, backref="orders_served", null=True)
-    status = pw.IntegerField(default=OrderStatus.IN_BASKET.value)
+    status = pw.IntegerField(default=OrderStatus.IN_BASKET.value, index=True)
     created_at = pw.DateTimeField(default=datetime.datetime.now)
     validated_at = pw.DateTimeField(null=True)
     ended_at = pw.DateTimeField(null=True)
+    # Kept up to date with the products of the order, in the same transaction as their changes
+    total = pw.IntegerField(default=0)
+    item_count = pw.IntegerField(default=0)
 
     class Meta:
         database = db
+        indexes = (
+            (('client', 'status'), False),
+        )
 
 
 class OrderProduct(pw.Model):
@@ -53,9 +62,37 @@ class OrderProduct(pw.Model):
         primary_key = pw.CompositeKey('order', 'product')
 
 
+class OrderEvent(pw.Model):
+    """Model to describe a change of the status of an order, pushed to the bar screens"""
+    id = pw.AutoField()
+    order = pw.ForeignKeyField(Order, backref="events", on_delete='CASCADE')
+    status = pw.IntegerField()
+    created_at = pw.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        database = db
+        table_name = 'order_event'
+
+
+"""Push of the order events to the clients of the worker"""
+order_events = EventBroadcaster('order_events', OrderEvent.select(OrderEvent, Order).join(Order), OrderEvent.id,
+                                ORDER_EVENTS_POLL_INTERVAL, ORDER_EVENTS_QUEUE_SIZE)
+
+
+def record_order_event(order: Order) -> None:
+    """
+    Record the current status of the order as an event
+    It must be called in the transaction changing the status, order_events.wake() is called after it.
+    :param order: changed order
+    """
+    event = OrderEvent.create(order=order, status=order.status)
+    order_events.notify(event.id)
+
+
 def calculate_total(order: Order) -> int:
     """
-    Return the total price of an order
+    Return the total price of an order computed from its products
+    The stored order.total is the value to use, this is only needed to check it.
     :param order: current order
     :return: Total price
     """
@@ -64,38 +101,197 @@ def calculate_total(order: Order) -> int:
         .scalar()
 
 
+def lock_basket(order: Order) -> None:
+    """
+    Lock the row of the basket until the end of the current transaction and reload its totals
+    So the concurrent changes of its products are applied one after the other.
+    SQLite doesn't need the lock, it locks the whole database on the first write.
+    :param order: basket to be locked
+    """
+    query = Order.select(Order.status, Order.total, Order.item_count).where(Order.id == order.id)
+    if db.for_update:
+        query = query.for_update()
+    current = query.get()
+    if current.status != OrderStatus.IN_BASKET.value:
+        raise HTTPException(
+            status_code=status.HTTP_417_EXPECTATION_FAILED,
+            detail="This order is not a basket anymore")
+    order.total = current.total
+    order.item_count = current.item_count
+
+
+def update_totals(order: Order, total_delta: int, item_count_delta: int) -> None:
+    """
+    Add the deltas to the stored total and item count of the order
+    :param order: changed order
+    :param total_delta: change of the total price
+    :param item_count_delta: change of the number of items
+    """
+    if total_delta == 0 and item_count_delta == 0:
+        return
+    Order.update(total=Order.total + total_delta, item_count=Order.item_count + item_count_delta)\
+        .where(Order.id == order.id)\
+        .execute()
+    order.total += total_delta
+    order.item_count += item_count_delta
+
+
+def set_order_products(order: Order, quantities: Dict[int, int], unit_price: int) -> List[OrderProduct]:
+    """
+    Set the quantities of products in the order, a quantity of 0 removes the product
+    The items are upserted in one query and removed in another, in the same transaction as the update
+    of the totals of the order.
+    :param order: order to be changed
+    :param quantities: new quantity of each product id
+    :param unit_price: price of the products, used only for the ones that are added
+    :return: the items of the order that were set, without the removed ones
+    """
+    removed = [product for product, quantity in quantities.items() if quantity == 0]
+    with write_transaction():
+        lock_basket(order)
+        current = {item.product: item for item in OrderProduct.select()
+                   .where((OrderProduct.order == order) & (OrderProduct.product.in_(list(quantities))))}
+        items = [current.get(product) or OrderProduct(order=order, product=product, unit_price=unit_price)
+                 for product, quantity in quantities.items() if quantity != 0]
+        total_delta = -sum(item.unit_price * item.quantity for item in current.values())
+        item_count_delta = -sum(item.quantity for item in current.values())
+        for item in items:
+            item.quantity = quantities[item.product]
+            total_delta += item.unit_price * item.quantity
+            item_count_delta += item.quantity
+        if removed:
+            OrderProduct.delete()\
+                .where((OrderProduct.order == order) & (OrderProduct.product.in_(removed)))\
+                .execute()
+        if items:
+            OrderProduct.insert_many([(order.id, item.product, item.unit_price, item.quantity) for item in items],
+                                     fields=[OrderProduct.order, OrderProduct.product,
+                                             OrderProduct.unit_price, OrderProduct.quantity])\
+                .on_conflict(conflict_target=[OrderProduct.order, OrderProduct.product],
+                             update={OrderProduct.quantity: pw.EXCLUDED.quantity})\
+                .execute()
+        update_totals(order, total_delta, item_count_delta)
+    return items
+
+
+def set_order_product(order: Order, product: int, quantity: int, unit_price: int) -> Optional[OrderProduct]:
+    """
+    Set the quantity of a product in the order, a quantity of 0 removes it
+    :param order: order to be changed
+    :param product: id of the product
+    :param quantity: new quantity of the product
+    :param unit_price: price of the product, used only when it is added
+    :return: the item of the order, None if it was removed
+    """
+    items = set_order_products(order, {product: quantity}, unit_price)
+    return items[0] if items else None
+
+
+def delete_basket(order: Order) -> None:
+    """
+    Delete the basket with its products
+    :param order: basket to be deleted
+    """
+    with write_transaction():
+        lock_basket(order)
+        OrderProduct.delete().where(OrderProduct.order == order).execute()
+        order.delete_instance()
+
+
+def check_order_totals(fix: bool = False) -> List[Tuple[int, int, int, int, int]]:
+    """
+    Recompute the totals of all the orders and compare them to the stored ones
+    :param fix: whether the wrong totals are replaced by the recomputed ones
+    :return: (order id, stored total, stored item count, computed total, computed item count)
+     of each order whose stored totals are wrong
+    """
+    products = OrderProduct.select(OrderProduct.order_id,
+                                   pw.fn.SUM(OrderProduct.unit_price * OrderProduct.quantity).alias('total'),
+                                   pw.fn.SUM(OrderProduct.quantity).alias('item_count'))\
+        .group_by(OrderProduct.order_id)\
+        .alias('products')
+    total = pw.fn.COALESCE(products.c.total, 0)
+    item_count = pw.fn.COALESCE(products.c.item_count, 0)
+    query = Order.select(Order.id, Order.total, Order.item_count, total, item_count)\
+        .join(products, pw.JOIN.LEFT_OUTER, on=(products.c.order_id == Order.id))\
+        .where((Order.total != total) | (Order.item_count != item_count))\
+        .order_by(Order.id)\
+        .tuples()
+    with write_transaction():
+        wrong = list(query)
+        if fix:
+            items = OrderProduct.select().where(OrderProduct.order_id == Order.id)
+            computed_total = items.select(pw.fn.COALESCE(pw.fn.SUM(OrderProduct.unit_price * OrderProduct.quantity), 0))
+            computed_item_count = items.select(pw.fn.COALESCE(pw.fn.SUM(OrderProduct.quantity), 0))
+            for rows in pw.chunked(wrong, 500):
+                Order.update(total=computed_total, item_count=computed_item_count)\
+                    .where(Order.id.in_([row[0] for row in rows]))\
+                    .execute()
+    return wrong
+
+
 def validate_order(order: Order) -> None:
     """
     Validate the order
+    The balance is debited by a guarded update in the same transaction as the status change.
+    So concurrent checkouts can't spend the same money twice or validate the same basket twice.
     :param order: order to be validated
     """
     # TODO: check product availability and price + update storage
-    total = calculate_total(order)
-    if order.client.balance < total:
-        raise HTTPException(
-            status_code=status.HTTP_417_EXPECTATION_FAILED,
-            detail="User doesn't have enough money to validate the order. Please update the order.")
-    order.client.balance -= total
-    order.client.save()
-    order.status = OrderStatus.VALIDATED.value
-    order.validated_at = datetime.datetime.now()
-    order.save()
+    from models.ledger import record_movement  # The ledger references the orders
+
+    with write_transaction():
+        validated_at = datetime.datetime.now()
+        validated = Order.update(status=OrderStatus.VALIDATED.value, validated_at=validated_at)\
+            .where((Order.id == order.id) & (Order.status == OrderStatus.IN_BASKET.value))\
+            .execute()
+        if validated == 0:
+            raise HTTPException(
+                status_code=status.HTTP_417_EXPECTATION_FAILED,
+                detail="This order is not a basket anymore")
+        # The row is locked by the update, so the total can't be changed by another request anymore
+        order.total = Order.select(Order.total).where(Order.id == order.id).scalar()
+        debited = User.update(balance=User.balance - order.total)\
+            .where((User.id == order.client_id) & (User.balance >= order.total))\
+            .execute()
+        if debited == 0:
+            raise HTTPException(
+                status_code=status.HTTP_417_EXPECTATION_FAILED,
+                detail="User doesn't have enough money to validate the order. Please update the order.")
+        record_movement(order.client_id, -order.total, order=order)
+        order.status = OrderStatus.VALIDATED.value
+        order.validated_at = validated_at
+        record_order_event(order)
+    order_events.wake()
 
 
 def cancel_order_by(order: Order, barman: User) -> None:
     """
     Cancel the order
+    The money is given back only if the order was validated, in the same transaction as the status change.
     :param order: order to be cancelled
     :param barman: user cancelling the order
     """
     # TODO: update storage
-    total = calculate_total(order)
-    order.client.balance += total
-    order.client.save()
-    order.status = OrderStatus.CANCELLED.value
-    order.ended_at = datetime.datetime.now()
-    order.barman = barman
-    order.save()
+    from models.ledger import record_movement  # The ledger references the orders
+
+    with write_transaction():
+        ended_at = datetime.datetime.now()
+        cancelled = Order.update(status=OrderStatus.CANCELLED.value, ended_at=ended_at, barman=barman)\
+            .where((Order.id == order.id) & (Order.status == order.status))\
+            .execute()
+        if cancelled == 0:
+            raise HTTPException(
+                status_code=status.HTTP_417_EXPECTATION_FAILED,
+                detail="This order was changed at the same time. Please retry.")
+        if order.status == OrderStatus.VALIDATED.value:
+            User.update(balance=User.balance + order.total).where(User.id == order.client_id).execute()
+            record_movement(order.client_id, order.total, order=order)
+        order.status = OrderStatus.CANCELLED.value
+        order.ended_at = ended_at
+        order.barman = barman
+        record_order_event(order)
+    order_events.wake()
 
 
 def finish_the_order(order: Order, barman: User) -> None:
@@ -105,7 +301,10 @@ def finish_the_order(order: Order, barman: User) -> None:
     :param order: order to be finished
     :param barman: user cancelling the order
     """
-    order.status = OrderStatus.FINISHED.value
-    order.ended_at = datetime.datetime.now()
-    order.barman = barman
-    order.save()
+    with write_transaction():
+        order.status = OrderStatus.FINISHED.value
+        order.ended_at = datetime.datetime.now()
+        order.barman = barman
+        order.save()
+        record_order_event(order)
+    order_events.wake()
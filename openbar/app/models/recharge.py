@@ -6,11 +6,12 @@ Definition of Recharge model
 """
 
 import datetime
+from typing import Dict, List
 
 import peewee as pw
 
 from models.user import User
-from tools.db import db
+from tools.db import db, returning_supported, write_transaction
 
 
 class Recharge(pw.Model):
@@ -23,3 +24,48 @@ class Recharge(pw.Model):
 
     class Meta:
         database = db
+        indexes = (
+            (('client', 'created_at'), False),
+        )
+
+
+def create_recharges(barman: User, values: List[tuple[int, int]]) -> List[Recharge]:
+    """
+    Create the recharges and credit the balances of their clients in one transaction
+    The rows are inserted in batches and each balance gets a single atomic increment.
+    The clients and values must have been checked before.
+    :param barman: user doing the recharges
+    :param values: (client id, value) of each recharge
+    :return: the created recharges, in the same order
+    """
+    from models.ledger import record_recharges  # The ledger references the recharges
+
+    created_at = datetime.datetime.now()
+    recharges = [Recharge(barman=barman, client=client, value=value, created_at=created_at)
+                 for client, value in values]
+    increments: Dict[int, int] = {}
+    for client, value in values:
+        increments[client] = increments.get(client, 0) + value
+    fields = [Recharge.barman, Recharge.client, Recharge.value, Recharge.created_at]
+    with write_transaction():
+        for batch in pw.chunked(recharges, 500):
+            rows = [(barman.id, recharge.client_id, recharge.value, created_at) for recharge in batch]
+            query = Recharge.insert_many(rows, fields=fields)
+            if returning_supported:
+                ids = [recharge_id for recharge_id, in query.returning(Recharge.id).tuples().execute()]
+            else:
+                query.execute()
+                # The write transaction holds the lock, the recharges of the barman at created_at are the new ones
+                ids = [recharge_id for recharge_id, in Recharge.select(Recharge.id)
+                       .where((Recharge.barman == barman) & (Recharge.created_at == created_at))
+                       .order_by(Recharge.id.desc()).limit(len(batch)).tuples()]
+            # The ids are given in the order of the rows, but the order of the returned rows is not guaranteed
+            for recharge, recharge_id in zip(batch, sorted(ids)):
+                recharge.id = recharge_id
+        for batch in pw.chunked(increments.items(), 500):
+            increment = pw.Case(User.id, batch)
+            User.update(balance=User.balance + increment)\
+                .where(User.id.in_([client for client, _ in batch]))\
+                .execute()
+        record_recharges(recharges)
+    return recharges
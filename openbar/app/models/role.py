@@ -4,13 +4,15 @@
 """
 Definition of Role model
 """
-from typing import List
+from typing import Callable
 
 import peewee as pw
 from fastapi import HTTPException
 from starlette import status
 
-from models.permission import Permission
+from config import CACHE_VERSION_CHECK_INTERVAL
+from models.cacheversion import VersionedCache
+from models.permission import Permission, LoginType
 from tools.db import db
 
 
@@ -33,21 +35,98 @@ class RolePermission(Permission):
 
     class Meta:
         database = db
+        indexes = (
+            (('role_id', 'login_type'), False),
+        )
 
 
-def getChildren(role: Role) -> List[Role]:
-    """Return the recursively role children of a given role"""
-    children = []
-    wait_stack = [role]
-    while len(wait_stack) != 0:
-        actual_role = wait_stack.pop()
-        if actual_role in children:
-            raise HTTPException(
-                status_code=status.HTTP_417_EXPECTATION_FAILED,
-                detail="The parent can't be one of it's children.")
-        children.append(actual_role)
-        wait_stack += list(actual_role.children)
-    return children
+def descendants_cte(role_id: int) -> pw.CTE:
+    """Return the recursive CTE of the identifiers of a role and of all its descendants
+    UNION (and not UNION ALL) stops the recursion if the tree has a cycle.
+    """
+    base = Role.select(Role.id).where(Role.id == role_id).cte('descendants', recursive=True, columns=('id',))
+    child = Role.alias()
+    recursive = child.select(child.id).join(base, on=(child.parent == base.c.id))
+    return base.union(recursive)
+
+
+def ancestors_cte(role_id: int) -> pw.CTE:
+    """Return the recursive CTE of the identifiers of a role and of all its ancestors"""
+    base = Role.select(Role.id, Role.parent).where(Role.id == role_id)\
+        .cte('ancestors', recursive=True, columns=('id', 'parent_id'))
+    parent = Role.alias()
+    recursive = parent.select(parent.id, parent.parent).join(base, on=(parent.id == base.c.parent_id))
+    return base.union(recursive)
+
+
+class RolePermissionCache(VersionedCache):
+    """Permissions of each role for each login type, kept in memory by the worker"""
+
+    def __init__(self, check_interval: float):
+        super().__init__('role_permissions', check_interval)
+        self._permissions = {}
+
+    def _clear(self) -> None:
+        self._permissions.clear()
+
+    def get(self, role_id: int, login_type: LoginType) -> list[str]:
+        """Return the permissions given by a role for a login type"""
+        version = self.check_version()
+        with self._lock:
+            permissions = self._permissions.get(role_id)
+        if permissions is None:
+            permissions = {lt.value: [] for lt in LoginType}
+            for p in RolePermission.select(RolePermission.permission, RolePermission.range,
+                                           RolePermission.login_type)\
+                    .where(RolePermission.role_id == role_id):
+                permissions[p.login_type].append(f"{p.permission}.{p.range}")
+            with self._lock:
+                if version == self._version:
+                    self._permissions[role_id] = permissions
+        return list(permissions[login_type.value])
+
+
+class RoleTreeCache(VersionedCache):
+    """Descendants and ancestors of each role, kept in memory by the worker"""
+
+    def __init__(self, check_interval: float):
+        super().__init__('role_tree', check_interval)
+        self._descendants = {}
+        self._ancestors = {}
+
+    def _clear(self) -> None:
+        self._descendants.clear()
+        self._ancestors.clear()
+
+    def _get(self, cached: dict, make_cte: Callable[[int], pw.CTE], role_id: int, fresh: bool) -> frozenset[int]:
+        version = self.check_version(fresh)
+        with self._lock:
+            ids = cached.get(role_id)
+        if ids is None:
+            cte = make_cte(role_id)
+            ids = frozenset(row[0] for row in cte.select_from(cte.c.id).tuples())
+            with self._lock:
+                if version == self._version:
+                    cached[role_id] = ids
+        return ids
+
+    def descendants(self, role_id: int, fresh: bool = False) -> frozenset[int]:
+        """Return the identifiers of the role and of all its descendants
+        fresh checks the version even if it was checked less than check_interval ago, for the write paths.
+        """
+        return self._get(self._descendants, descendants_cte, role_id, fresh)
+
+    def ancestors(self, role_id: int, fresh: bool = False) -> frozenset[int]:
+        """Return the identifiers of the role and of all its ancestors"""
+        return self._get(self._ancestors, ancestors_cte, role_id, fresh)
+
+    def is_ancestor(self, ancestor_id: int, role_id: int, fresh: bool = False) -> bool:
+        """Check if a role is the given role or one of its ancestors"""
+        return ancestor_id in self.ancestors(role_id, fresh)
+
+
+role_permission_cache = RolePermissionCache(CACHE_VERSION_CHECK_INTERVAL)
+role_tree_cache = RoleTreeCache(CACHE_VERSION_CHECK_INTERVAL)
 
 
 def test_parent_validity(child: Role, parent: Role) -> None:
@@ -58,7 +137,7 @@ def test_parent_validity(child: Role, parent: Role) -> None:
         raise HTTPException(
             status_code=status.HTTP_417_EXPECTATION_FAILED,
             detail="The parent can't be the role itself")
-    if parent in getChildren(child):
+    if role_tree_cache.is_ancestor(child.id, parent.id, fresh=True):
         raise HTTPException(
             status_code=status.HTTP_417_EXPECTATION_FAILED,
             detail="The parent cannot be one of the children of its child")
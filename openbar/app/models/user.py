@@ -6,16 +6,20 @@
 Definition of User model and tools associated
 """
 
-from datetime import date
-from typing import Optional
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import date, datetime
+from typing import Dict, Optional
 
 import peewee as pw
 
+from config import LAST_LOGIN_FLUSH_INTERVAL
 from models.cardsalt import CardSalt
 from models.permission import LoginType, Permission
-from models.role import Role, RolePermission
-from tools.crypto import verify_password, hash_card_id, verify_card_id
-from tools.db import db
+from models.role import Role, role_permission_cache
+from tools.crypto import verify_password, hash_card_id, verify_card_id, card_blind_index, card_hash_pool
+from tools.background import PeriodicTask
+from tools.db import db, write_transaction
 
 
 class User(pw.Model):
@@ -28,6 +32,7 @@ class User(pw.Model):
     role = pw.ForeignKeyField(Role, backref="users")
 
     card_id = pw.CharField()
+    card_index = pw.CharField(null=True, index=True)
     salt = pw.ForeignKeyField(CardSalt, backref="users")
 
     balance = pw.IntegerField(default=0)
@@ -39,6 +44,9 @@ class User(pw.Model):
 
     class Meta:
         database = db
+        indexes = (
+            (('salt', 'card_id'), False),
+        )
 
 
 class UserPermission(Permission):
@@ -49,17 +57,55 @@ class UserPermission(Permission):
 
     class Meta:
         database = db
+        indexes = (
+            (('user_id', 'login_type'), False),
+        )
 
 
 def search_user(card_id: str) -> Optional[User]:
-    """Return an user by its card ID"""
-    salt_list = CardSalt.select().order_by(CardSalt.year.desc())
-    for salt in salt_list:
-        try:
-            return User.get(User.salt == salt.year,
-                            User.card_id == hash_card_id(card_id, salt.salt))
-        except User.DoesNotExist:
-            pass
+    """Return an user by its card ID
+    The user is found with the card blind index then the card ID is verified against its argon2 hash.
+    Users without blind index (created before it existed) are searched with every yearly salt
+    and their blind index is filled when they are found.
+    """
+    index = card_blind_index(card_id)
+    user = User.get_or_none(User.card_index == index)
+    if user is not None:
+        if verify_user_card_id(user, card_id):
+            return user
+        return None
+    if not User.select().where(User.card_index.is_null()).exists():
+        return None
+    user = search_user_by_salt(card_id)
+    if user is not None:
+        User.update(card_index=index).where(User.id == user.id).execute()
+        user.card_index = index
+    return user
+
+
+def search_user_by_salt(card_id: str) -> Optional[User]:
+    """Return an user without blind index by its card ID, trying every yearly salt
+    The card ID is hashed with all the salts in parallel.
+    Each time some hashes are ready, they are searched with a single query
+    and the remaining hashes are cancelled as soon as the user is found.
+    """
+    pending = {card_hash_pool.submit(hash_card_id, card_id, salt.salt): salt.year
+               for salt in CardSalt.select()}
+    try:
+        while len(pending) != 0:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            hashes = {pending.pop(future): future.result() for future in done}
+            user = User.select()\
+                .where(User.card_index.is_null()
+                       & User.salt.in_(list(hashes.keys()))
+                       & User.card_id.in_(list(hashes.values())))\
+                .order_by(User.salt.desc())\
+                .first()
+            if user is not None:
+                return user
+    finally:
+        for future in pending:
+            future.cancel()
     return None
 
 
@@ -76,19 +122,77 @@ def verify_user_card_id(user: User, card_id: str) -> bool:
 
 
 def list_permissions(user: User, login_type: LoginType) -> list[str]:
-    """List permissions of a given user"""
+    """List permissions of a given user
+    The permissions of its role come from the cache, only the permissions of the user are queried.
+    """
     def build_string(perms) -> list[str]:
         return [f"{p.permission}.{p.range}" for p in perms]
 
-    role_perm = build_string(RolePermission.select(RolePermission.permission, RolePermission.range)
-                             .where((RolePermission.role_id == user.role.id)
-                                    & (RolePermission.login_type == login_type.value)))
+    role_perm = role_permission_cache.get(user.role_id, login_type)
     return role_perm + build_string(UserPermission.select(UserPermission.permission, UserPermission.range)
                                     .where((UserPermission.user_id == user.id)
                                            & (UserPermission.login_type == login_type.value)))
 
 
+class LastLoginTracker:
+    """
+    Last login dates waiting to be written to the database
+    A date is only written when it changes, so once a day per user, and all the pending ones are written
+    together by flush.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, user: User) -> None:
+        """
+        Set the last login of the user to today, the write is delayed until the next flush
+        :param user: user loaded from the database
+        """
+        today = date.today()
+        if isinstance(user.last_login, datetime) and user.last_login.date() == today:
+            return
+        # A datetime and not a string, PostgreSQL refuses to put the text of a CASE in a timestamp column
+        last_login = datetime.combine(today, datetime.min.time())
+        with self._lock:
+            self._pending[user.id] = last_login
+        user.last_login = last_login
+
+    def flush(self) -> int:
+        """
+        Write the pending last login dates with one bulk update per batch of users
+        :return: the number of users updated
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with write_transaction():
+                for batch in pw.chunked(pending.items(), 500):
+                    User.update(last_login=pw.Case(User.id, batch))\
+                        .where(User.id.in_([user_id for user_id, _ in batch]))\
+                        .execute()
+        except Exception:
+            # They are written with the next flush, unless the users logged in again since
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            raise
+        return len(pending)
+
+
+last_login_tracker = LastLoginTracker()
+
+"""Task of each worker writing the last login dates, and the last ones when it stops"""
+last_login_task = PeriodicTask('last-login', LAST_LOGIN_FLUSH_INTERVAL, last_login_tracker.flush, run_on_stop=True)
+
+
 def update_last_login(user: User):
-    """Update last login date for a given user"""
-    user.last_login = str(date.today())
-    user.save()
+    """Update last login date for a given user
+    It only changes the dates kept in memory, they are written to the database by the last_login_task.
+    """
+    last_login_tracker.touch(user)
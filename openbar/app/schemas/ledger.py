@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, Field
+from pydantic.utils import GetterDict
+import peewee as pw
+
+
+class MovementGetter(GetterDict):
+    def get(self, key: Any, default: Any = None) -> Any:
+        # Read the foreign keys from the row, so the related objects are not fetched
+        if key in ('user', 'recharge', 'order'):
+            return getattr(self._obj, f"{key}_id")
+        res = getattr(self._obj, key, default)
+        if isinstance(res, pw.ModelSelect):
+            return list(res)
+        return res
+
+
+class Movement(BaseModel):
+    id: int = Field(..., description='Movement id')
+    user: int = Field(..., description='Id of the user whose balance changed')
+    amount: int = Field(..., description='Signed change of the balance * 100')
+    recharge: Optional[int] = Field(None, description='Id of the recharge behind the movement')
+    order: Optional[int] = Field(None, description='Id of the order behind the movement')
+    created_at: datetime = Field(..., description='Date of the movement')
+
+    class Config:
+        orm_mode = True
+        getter_dict = MovementGetter
+
+
+class Balance(BaseModel):
+    user: int = Field(..., description='Id of the user')
+    date: datetime = Field(..., description='Date of the balance')
+    balance: int = Field(..., description='Balance at this date * 100')
+
+
+class Statement(BaseModel):
+    user: int = Field(..., description='Id of the user')
+    start: datetime = Field(..., description='Start of the statement')
+    end: datetime = Field(..., description='End of the statement')
+    opening_balance: int = Field(..., description='Balance at the start * 100')
+    closing_balance: int = Field(..., description='Balance at the end * 100')
+    movements: List[Movement] = Field(..., description='Movements between the start and the end')
@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Any
+
+from pydantic import BaseModel, Field
+from pydantic.utils import GetterDict
+import peewee as pw
+
+
+class LoginEventGetter(GetterDict):
+    def get(self, key: Any, default: Any = None) -> Any:
+        # Read the foreign key from the row, so the user is not fetched
+        if key == 'user':
+            return self._obj.user_id
+        res = getattr(self._obj, key, default)
+        if isinstance(res, pw.ModelSelect):
+            return list(res)
+        return res
+
+
+class LoginEventOut(BaseModel):
+    id: int = Field(..., description='Login event id')
+    user: int = Field(..., description='Id of the user trying to login')
+    created_at: datetime = Field(..., description='Date of the login')
+    succeeded: bool = Field(..., description='Whether the user was authenticated')
+    partial: bool = Field(..., description='Whether it was a login with the card only')
+
+    class Config:
+        orm_mode = True
+        getter_dict = LoginEventGetter
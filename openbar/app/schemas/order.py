@@ -13,12 +13,13 @@ import peewee as pw
 
 class OrderGetter(GetterDict):
     def get(self, key: Any, default: Any = None) -> Any:
+        # Read the foreign keys from the row, so the related users are not fetched
         if key == 'client':
-            return self._obj.client.id
+            return self._obj.client_id
         elif key == 'barman':
-            if self._obj.barman is None:
+            if self._obj.barman_id is None:
                 return default
-            return self._obj.barman.id
+            return self._obj.barman_id
         res = getattr(self._obj, key, default)
         if isinstance(res, pw.ModelSelect):
             return list(res)
@@ -33,6 +34,8 @@ class Order(BaseModel):
     created_at: Optional[datetime.datetime] = Field(None, description="")
     validated_at: Optional[datetime.datetime] = Field(None, description="")
     ended_at: Optional[datetime.datetime] = Field(None, description="")
+    total: int = Field(0, description='Total price of the products in the order')
+    item_count: int = Field(0, description='Number of items in the order')
 
     class Config:
         orm_mode = True
@@ -40,10 +43,21 @@ class Order(BaseModel):
         use_enum_values = True
 
 
+class OrderEvent(BaseModel):
+    id: int = Field(..., description='Event id, given back in the Last-Event-ID header to resume the stream')
+    status: OrderStatus = Field(..., description='Status of the order after the event')
+    created_at: datetime.datetime = Field(..., description='Date of the event')
+    order: Order = Field(..., description='Order, as it is now')
+
+    class Config:
+        orm_mode = True
+        use_enum_values = True
+
+
 class OrderProductGetter(GetterDict):
     def get(self, key: Any, default: Any = None) -> Any:
         if key == 'order':
-            return self._obj.order.id
+            return self._obj.order_id
         # elif key == 'product':
         #    return self._obj.product.id
         res = getattr(self._obj, key, default)
@@ -61,3 +75,8 @@ class OrderProduct(BaseModel):
     class Config:
         orm_mode = True
         getter_dict = OrderProductGetter
+
+
+class BasketItem(BaseModel):
+    product: int = Field(..., description='Product id')
+    quantity: int = Field(..., description='New quantity of the product in the basket, 0 to remove it')
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, Any
+from typing import List, Optional, Any
 
 from pydantic import BaseModel, Field
 from pydantic.utils import GetterDict
@@ -8,10 +8,11 @@ import peewee as pw
 
 class RechargeGetter(GetterDict):
     def get(self, key: Any, default: Any = None) -> Any:
+        # Read the foreign keys from the row, so the related users are not fetched
         if key == 'client':
-            return self._obj.client.id
+            return self._obj.client_id
         elif key == 'barman':
-            return self._obj.barman.id
+            return self._obj.barman_id
         res = getattr(self._obj, key, default)
         if isinstance(res, pw.ModelSelect):
             return list(res)
@@ -32,3 +33,10 @@ class RechargeOut(RechargeIn):
     barman: int = Field(..., description='Id of the barman who did the recharge')
     created_at: datetime = Field(..., description='Date of the recharge')
 
+
+class RechargeResult(BaseModel):
+    client: int = Field(..., description='Id of the client')
+    value: int = Field(..., description='Recharge value * 100')
+    status: int = Field(..., description='HTTP status code of this recharge')
+    detail: Optional[str] = Field(None, description='Reason why the recharge was refused')
+    recharge: Optional[RechargeOut] = Field(None, description='Created recharge')
@@ -10,10 +10,11 @@ from schemas import AllOptional
 
 class RoleGetter(GetterDict):
     def get(self, key: Any, default: Any = None) -> Any:
+        # Read the foreign key from the row, so the parent is not fetched
         if key == 'parent':
-            if self._obj.parent is None:
+            if self._obj.parent_id is None:
                 return default
-            return self._obj.parent.id
+            return self._obj.parent_id
         res = getattr(self._obj, key, default)
         if isinstance(res, pw.ModelSelect):
             return list(res)
@@ -11,8 +11,9 @@ from schemas import AllOptional
 
 class UserGetter(GetterDict):
     def get(self, key: Any, default: Any = None):
+        # Read the foreign key from the row, so the role is not fetched
         if key == 'role':
-            return self._obj.role.id
+            return self._obj.role_id
         res = getattr(self._obj, key, default)
         if isinstance(res, pw.ModelSelect):
             return list(res)
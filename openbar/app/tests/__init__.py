@@ -0,0 +1,5 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests of OpenBar, run against a temporary SQLite database
+"""
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Fixtures of the unit tests
+"""
+
+import os
+import tempfile
+
+import pytest
+
+# The database must be chosen before tools.db is imported
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['DATABASE'] = f"sqlite:///{DATABASE_PATH}"
+
+
+class QueryCounter:
+    """Count the SQL queries run on the database, and keep them with their parameters"""
+
+    def __init__(self, database):
+        self.database = database
+        self.count = 0
+        self.queries = []
+        self._execute_sql = None
+
+    def __enter__(self):
+        self._execute_sql = self.database.execute_sql
+
+        def execute_sql(sql, params=None, *args, **kwargs):
+            self.count += 1
+            self.queries.append((sql, params))
+            return self._execute_sql(sql, params, *args, **kwargs)
+
+        self.database.execute_sql = execute_sql
+        return self
+
+    def __exit__(self, *exc):
+        del self.database.execute_sql
+
+
+@pytest.fixture
+def database():
+    """Give an empty database with all the tables"""
+    from models import create_tables
+    from tools.db import db
+
+    db.close_all()
+    if os.path.exists(DATABASE_PATH):
+        os.remove(DATABASE_PATH)
+    db.connect()
+    create_tables()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def count_queries(database):
+    """Return a context manager counting the queries run inside it"""
+    return lambda: QueryCounter(database)
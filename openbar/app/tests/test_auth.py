@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the authentication of the requests and of its caches
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPBasicCredentials
+
+import tools.auth
+import tools.cache
+from apis.user import anonymize_user, delete_user
+from config import TOKEN_VALIDITY_TIME
+from models.cardsalt import CardSalt
+from models.role import Role
+from models.user import User
+from tools.auth import get_current_user, invalidate_user, token_cache
+from tools.cache import ExpiringLRUCache
+from tools.crypto import generate_salt, generate_user_token, hash_password
+
+
+class Clock:
+    """Time of the caches, moved forward by the tests"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tools.cache, 'time', clock)
+    monkeypatch.setattr(tools.auth, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def user(database, clock):
+    """Return a user with a username and a password, the caches of the worker being empty"""
+    token_cache.clear()
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    yield User.create(first_name="First", name="Client", role=role, card_id="0", salt=salt, group_year=2022,
+                      username="client", password=hash_password("password", generate_salt()))
+    token_cache.clear()
+
+
+def authenticate(token=None, credentials=None):
+    """Return the user and the permissions of a request"""
+    return asyncio.run(get_current_user(token, credentials))
+
+
+def test_token_is_cached(user, count_queries):
+    # decode_user_token gives no audience to PyJWT, so only the tokens without permission are accepted
+    token = generate_user_token(user.id, [])
+    authenticate(token)
+    with count_queries() as counter:
+        logged, permissions = authenticate(token)
+    assert counter.count == 0
+    assert (logged.id, logged.name, permissions) == (user.id, "Client", [])
+
+
+def test_token_cache_is_invalidated_by_a_user_update(user):
+    token = generate_user_token(user.id, [])
+    authenticate(token)
+    User.update(name="Renamed").where(User.id == user.id).execute()
+    # Without invalidation, the worker keeps the old values until the entry expires
+    assert authenticate(token)[0].name == "Client"
+    invalidate_user(user.id)
+    assert authenticate(token)[0].name == "Renamed"
+
+
+def test_token_cache_is_invalidated_by_a_user_deletion(user):
+    token = generate_user_token(user.id, [])
+    authenticate(token)
+    delete_user(user.id)
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    assert error.value.status_code == 401
+
+
+def test_token_cache_is_invalidated_by_an_anonymization(user, count_queries, monkeypatch):
+    token = generate_user_token(user.id, [])
+    authenticate(token)
+    # The anonymized row can't be written, its group_year is set to NULL, only the invalidation is checked
+    monkeypatch.setattr(User, 'save', lambda self, *args, **kwargs: 1)
+    anonymize_user(user.id)
+    with count_queries() as counter:
+        authenticate(token)
+    assert counter.count == 1
+
+
+def test_token_cache_expires(user, clock):
+    token = generate_user_token(user.id, [])
+    authenticate(token)
+    # A user deleted by another worker is still seen until the entry expires, then the token is refused
+    User.delete_by_id(user.id)
+    clock.now += tools.auth.TOKEN_CACHE_MAX_AGE - 1
+    assert authenticate(token)[0].id == user.id
+    clock.now += 1
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    assert error.value.status_code == 401
+
+
+def test_token_cache_expires_with_the_token(user, clock, count_queries, monkeypatch):
+    """A token is not served from the cache after its expiration, whatever TOKEN_CACHE_MAX_AGE is"""
+    monkeypatch.setattr(tools.auth, 'TOKEN_CACHE_MAX_AGE', 10 ** 6)
+    token = generate_user_token(user.id, [])
+    authenticate(token)
+    with count_queries() as counter:
+        authenticate(token)
+    assert counter.count == 0
+    clock.now += TOKEN_VALIDITY_TIME + 1
+    with count_queries() as counter:
+        authenticate(token)
+    assert counter.count == 1
+
+
+@pytest.fixture
+def credential_cache(monkeypatch):
+    """Enable the cache of the HTTP Basic authentications, disabled by default"""
+    cache = ExpiringLRUCache(16)
+    monkeypatch.setattr(tools.auth, 'credential_cache', cache)
+    monkeypatch.setattr(tools.auth, 'BASIC_AUTH_CACHE_TTL', 60)
+    return cache
+
+
+def test_credentials_are_cached(user, credential_cache, count_queries):
+    credentials = HTTPBasicCredentials(username="client", password="password")
+    authenticate(credentials=credentials)
+    with count_queries() as counter:
+        logged, permissions = authenticate(credentials=credentials)
+    assert counter.count == 0
+    assert logged.id == user.id
+    assert len(credential_cache) == 1
+
+
+def test_wrong_password_is_not_served_from_the_cache(user, credential_cache):
+    authenticate(credentials=HTTPBasicCredentials(username="client", password="password"))
+    for username, password in [("client", "wrong"), ("client", "password "), ("unknown", "password")]:
+        with pytest.raises(HTTPException) as error:
+            authenticate(credentials=HTTPBasicCredentials(username=username, password=password))
+        assert error.value.status_code == 403
+    assert len(credential_cache) == 1
+
+
+def test_credential_cache_is_invalidated_by_a_password_update(user, credential_cache):
+    old = HTTPBasicCredentials(username="client", password="password")
+    authenticate(credentials=old)
+    User.update(password=hash_password("new password", generate_salt())).where(User.id == user.id).execute()
+    invalidate_user(user.id)
+    with pytest.raises(HTTPException) as error:
+        authenticate(credentials=old)
+    assert error.value.status_code == 403
+    assert authenticate(credentials=HTTPBasicCredentials(username="client", password="new password"))[0].id == user.id
+
+
+def test_credential_cache_expires(user, credential_cache, clock):
+    credentials = HTTPBasicCredentials(username="client", password="password")
+    authenticate(credentials=credentials)
+    # Another worker changed the password, this one accepts the old one until the entry expires
+    User.update(password=hash_password("new password", generate_salt())).where(User.id == user.id).execute()
+    clock.now += 59
+    assert authenticate(credentials=credentials)[0].id == user.id
+    clock.now += 1
+    with pytest.raises(HTTPException):
+        authenticate(credentials=credentials)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the SQLite profile and of the routing of the queries to the read replicas
+"""
+
+import shutil
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+
+import pytest
+
+from models.role import Role, RoleTreeCache
+from tools.db import db, db_route_current, db_state_default, is_read_only, open_database, write_transaction
+
+
+def test_sqlite_profile(database):
+    """The connections are in WAL mode and check the foreign keys"""
+    assert database.pragma('journal_mode') == 'wal'
+    assert database.pragma('foreign_keys') == 1
+
+
+def test_write_transaction_waits_for_other_writers(database):
+    """A write transaction reading first waits for the write lock held by another process instead of failing"""
+    other = sqlite3.connect(database.database, isolation_level=None, check_same_thread=False)
+    other.execute('BEGIN IMMEDIATE')
+    other.execute("INSERT INTO role (name) VALUES ('Barman')")
+    release = threading.Timer(0.2, lambda: other.execute('COMMIT'))
+    release.start()
+    start = time.monotonic()
+    with write_transaction():
+        if Role.select().count() == 1:
+            Role.create(name="Client")
+    assert time.monotonic() - start >= 0.2
+    release.join()
+    other.close()
+    assert sorted(role.name for role in Role.select()) == ["Barman", "Client"]
+
+
+@pytest.fixture
+def replica(database, tmp_path):
+    """Return a replica lagging behind the primary: it only has the role Client"""
+    Role.create(name="Client")
+    path = tmp_path / 'replica.db'
+    database.execute_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    shutil.copy(database.database, path)
+    replica = open_database(f"sqlite:///{path}", ContextVar("db_state_test_replica", default=db_state_default.copy()))
+    Role.create(name="Barman")
+    token = db_route_current.set({"replica": replica})
+    yield replica
+    db_route_current.reset(token)
+    replica.close()
+
+
+def role_names():
+    return [role.name for role in Role.select().order_by(Role.id)]
+
+
+def test_reads_stay_on_the_primary_after_a_write(replica):
+    """A read-only request reads from its replica until it writes"""
+    assert role_names() == ["Client"]
+    Role.create(name="Admin")
+    assert role_names() == ["Client", "Barman", "Admin"]
+    assert db_route_current.get()["replica"] is None
+
+
+def test_transactions_run_on_the_primary(replica):
+    """The reads of a transaction are run on the primary, like its writes"""
+    with db.atomic():
+        assert role_names() == ["Client", "Barman"]
+
+
+def test_cte_reads_run_on_the_replica(replica):
+    """The recursive CTEs of the role tree are reads, they don't move the request to the primary"""
+    client = Role.get(Role.name == "Client")
+    # The primary has the role Barman under Client, the replica doesn't have it yet
+    Role.update(parent=client).where(Role.name == "Barman").execute()
+    db_route_current.get()["replica"] = replica
+    assert RoleTreeCache(60).descendants(client.id) == {client.id}
+    assert db_route_current.get()["replica"] is replica
+
+
+@pytest.mark.parametrize('sql, read_only', [
+    ('SELECT "t1"."id" FROM "role" AS "t1"', True),
+    (' with recursive "descendants" ("id") AS (SELECT 1) SELECT "id" FROM "descendants"', True),
+    ('SELECT "t1"."update", \'delete\' FROM "role" AS "t1"', True),
+    ('WITH "new" AS (SELECT 1) INSERT INTO "role" ("name") SELECT \'a\' FROM "new"', False),
+    ('WITH "old" AS (DELETE FROM "role" RETURNING "id") SELECT "id" FROM "old"', False),
+    ('SELECT "t1"."id" FROM "user" AS "t1" WHERE ("t1"."id" = %s) FOR UPDATE', False),
+    ('UPDATE "user" SET "balance" = 0', False),
+    ('PRAGMA foreign_keys', False),
+])
+def test_read_only_statements(sql, read_only):
+    assert is_read_only(sql) == read_only
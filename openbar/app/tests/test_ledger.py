@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the balance ledger
+"""
+
+import datetime
+
+import pytest
+
+from models.cardsalt import CardSalt
+from models.ledger import BalanceMovement, BalanceSnapshot, balance_at, statement, take_snapshots, check_balances
+from models.order import Order, validate_order, cancel_order_by, set_order_product
+from models.recharge import create_recharges
+from models.role import Role
+from models.user import User
+
+
+@pytest.fixture
+def client(database):
+    """Return a client with an empty balance"""
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    return User.create(first_name="First", name="Client", role=role, card_id="0",
+                       salt=salt, group_year=2022, balance=0)
+
+
+def at(minutes: int) -> datetime.datetime:
+    """Return the date some minutes after the start of the tests"""
+    return datetime.datetime(2022, 9, 1) + datetime.timedelta(minutes=minutes)
+
+
+def test_balance_changes_are_recorded(client):
+    """The recharges, checkouts and refunds append a movement"""
+    recharge, = create_recharges(client, [(client.id, 10)])
+    order = Order.create(client=client)
+    set_order_product(order, 1, 2, unit_price=3)
+    validate_order(order)
+    cancel_order_by(order, client)
+    movements = [(movement.amount, movement.recharge_id, movement.order_id)
+                 for movement in BalanceMovement.select().order_by(BalanceMovement.id)]
+    assert movements == [(10, recharge.id, None), (-6, None, order.id), (6, None, order.id)]
+    assert check_balances() == []
+
+
+def test_empty_order_records_no_movement(client):
+    """An order whose total is 0 doesn't change the balance, it appends no movement"""
+    order = Order.create(client=client)
+    validate_order(order)
+    cancel_order_by(order, client)
+    create_recharges(client, [(client.id, 0)])
+    assert BalanceMovement.select().count() == 0
+    assert take_snapshots(at(1)) == 0
+
+
+def test_balance_at_uses_the_snapshots(client, count_queries):
+    """The balance at a date is the last snapshot plus the movements made since"""
+    for minutes, amount in [(1, 10), (2, -3), (4, 5), (6, -1)]:
+        if minutes == 4:
+            assert take_snapshots(at(3)) == 1
+        if minutes == 6:
+            assert take_snapshots(at(5)) == 1
+            assert take_snapshots(at(5)) == 0
+        BalanceMovement.create(user=client, amount=amount, created_at=at(minutes))
+    assert [snapshot.balance for snapshot in BalanceSnapshot.select().order_by(BalanceSnapshot.taken_at)] == [7, 12]
+    with count_queries() as counter:
+        assert [balance_at(client.id, at(minutes)) for minutes in range(8)] == [0, 10, 7, 7, 12, 12, 11, 11]
+    assert counter.count == 16
+    opening, movements = statement(client.id, at(2), at(6))
+    assert opening == 7
+    assert [movement.amount for movement in movements] == [5, -1]
+
+
+def test_late_movement_is_in_the_next_snapshot(client):
+    """A movement committed after a snapshot taken after its creation date is counted by the later balances"""
+    BalanceMovement.create(user=client, amount=10, created_at=at(1))
+    assert take_snapshots(at(3)) == 1
+    BalanceMovement.create(user=client, amount=-3, created_at=at(2))
+    assert [balance_at(client.id, at(minutes)) for minutes in (1, 2, 3, 4)] == [10, 7, 7, 7]
+    assert take_snapshots(at(4)) == 1
+    assert [(snapshot.balance, snapshot.last_movement_id)
+            for snapshot in BalanceSnapshot.select().order_by(BalanceSnapshot.taken_at)] == [(10, 1), (7, 2)]
+    assert [balance_at(client.id, at(minutes)) for minutes in (3, 4, 5)] == [7, 7, 7]
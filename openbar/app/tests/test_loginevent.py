@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the login history
+"""
+
+import peewee as pw
+import pytest
+
+import apis.auth
+from apis.auth import get_history
+from models.cardsalt import CardSalt
+from models.loginevent import LoginEvent, LoginHistory
+from models.role import Role
+from models.user import User
+from tools.pagination import Page
+
+
+@pytest.fixture
+def user(database):
+    """Return a user"""
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    return User.create(first_name="First", name="Client", role=role, card_id="0", salt=salt, group_year=2022)
+
+
+def test_flush_writes_the_buffer(user, count_queries):
+    """The logins are written with a batched insert and removed from the buffer"""
+    history = LoginHistory(10)
+    for succeeded in (True, False, True):
+        history.record(user.id, succeeded)
+    with count_queries() as counter:
+        assert history.flush() == 3
+    assert counter.count <= 3
+    assert len(history) == 0
+    assert [event.succeeded for event in LoginEvent.select().order_by(LoginEvent.id)] == [True, False, True]
+    assert history.flush() == 0
+
+
+def test_buffer_is_bounded(user):
+    """The oldest logins are dropped when the buffer is full"""
+    history = LoginHistory(2)
+    for partial in (False, True, True):
+        history.record(user.id, True, partial)
+    assert history.dropped == 1
+    assert history.flush() == 2
+    assert [event.partial for event in LoginEvent.select()] == [True, True]
+
+
+def test_flush_drops_the_logins_which_cant_be_written(user):
+    """The login of a deleted user is dropped, the other ones are written and nothing is left to retry"""
+    gone = User.create(first_name="First", name="Gone", role=user.role, card_id="1", salt=user.salt, group_year=2022)
+    history = LoginHistory(10)
+    history.record(user.id, True)
+    history.record(gone.id, True)
+    history.record(user.id, False)
+    gone.delete_instance()
+    assert history.flush() == 2
+    assert len(history) == 0
+    assert [(event.user_id, event.succeeded) for event in LoginEvent.select().order_by(LoginEvent.id)] \
+        == [(user.id, True), (user.id, False)]
+
+
+def test_flush_keeps_the_logins_when_the_database_fails(user, monkeypatch):
+    """The logins are put back when the database can't be reached, without pushing the newer ones out"""
+    history = LoginHistory(3)
+    for partial in (False, True):
+        history.record(user.id, True, partial)
+
+    def unavailable(*args, **kwargs):
+        history.record(user.id, False)
+        history.record(user.id, False)
+        raise pw.OperationalError("unable to open database file")
+
+    monkeypatch.setattr(LoginEvent, 'insert_many', unavailable)
+    with pytest.raises(pw.OperationalError):
+        history.flush()
+    monkeypatch.undo()
+    assert len(history) == 3
+    assert history.dropped == 1
+    assert history.flush() == 3
+    assert [(event.succeeded, event.partial) for event in LoginEvent.select().order_by(LoginEvent.id)] \
+        == [(True, True), (False, False), (False, False)]
+
+
+def test_deleting_a_user_deletes_its_logins(user):
+    """The login history of a user doesn't prevent its deletion"""
+    history = LoginHistory(10)
+    history.record(user.id, True)
+    history.flush()
+    user.delete_instance()
+    assert LoginEvent.select().count() == 0
+
+
+def test_history_endpoint_only_reads(user, count_queries, monkeypatch):
+    """The logins waiting in the buffer are written by the periodic task, not by the readers of the history"""
+    history = LoginHistory(10)
+    monkeypatch.setattr(apis.auth, 'login_history', history)
+    history.record(user.id, True)
+    history.flush()
+    history.record(user.id, False)
+    with count_queries() as counter:
+        events = get_history(Page(after_id=None, limit=10), user.id, None, None)
+    assert all(sql.startswith('SELECT') for sql, _ in counter.queries)
+    assert [event.succeeded for event in events] == [True]
+    assert len(history) == 1
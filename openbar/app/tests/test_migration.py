@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the migrations
+"""
+
+import os
+import threading
+
+import pytest
+
+from models.cardsalt import CardSalt
+from models.ledger import BalanceMovement, BalanceSnapshot
+from models.loginevent import LoginEvent
+from models.migration import __all_migrations__, LATEST_MIGRATION, check_migration, migrate
+from models.migration.MigrationHistory import MigrationHistory
+from models.order import Order, OrderEvent, OrderProduct
+from models.role import Role
+from models.user import User
+from models.migration.secondary_indexes import secondary_indexes, verify_indexes, create_secondary_indexes
+from tools.db import db, new_db_state
+
+
+def test_secondary_indexes(database):
+    """The indexes are created with the tables, and created again by their migration when missing"""
+    verify_indexes(secondary_indexes())
+    index, _ = secondary_indexes()[0]
+    database.execute_sql(f'DROP INDEX "{index._name}"')
+    with pytest.raises(RuntimeError):
+        verify_indexes(secondary_indexes())
+    create_secondary_indexes()
+    create_secondary_indexes()
+    verify_indexes(secondary_indexes())
+
+
+def test_check_migration(database):
+    """The workers refuse a database which is not at the latest migration"""
+    with pytest.raises(RuntimeError):
+        check_migration()
+    for name, _ in __all_migrations__[:-1]:
+        MigrationHistory.create(name=name)
+    with pytest.raises(RuntimeError):
+        check_migration()
+    MigrationHistory.create(name=LATEST_MIGRATION)
+    check_migration()
+
+
+def test_concurrent_migrations():
+    """Nodes migrating the same empty database at the same time apply the migrations once"""
+    db.close_all()
+    if os.path.exists(db.database):
+        os.remove(db.database)
+    errors = []
+    start = threading.Barrier(4)
+
+    def node():
+        new_db_state()
+        try:
+            db.connect()
+            start.wait()
+            migrate()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            db.close()
+
+    nodes = [threading.Thread(target=node) for _ in range(4)]
+    for thread in nodes:
+        thread.start()
+    for thread in nodes:
+        thread.join()
+    assert errors == []
+    db.connect()
+    try:
+        check_migration()
+        assert MigrationHistory.select().count() == len(__all_migrations__)
+    finally:
+        db.close()
+
+
+def test_upgrade_keeps_the_order_lines(database):
+    """Upgrading a database from before the order totals keeps its order lines and computes the totals"""
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    user = User.create(first_name="First", name="Client", role=role, card_id="0", salt=salt, group_year=2022)
+    order = Order.create(client=user)
+    OrderProduct.create(order=order, product=1, unit_price=3, quantity=2)
+    # Back to the schema of the database before the migration 0003_order_totals
+    database.drop_tables([BalanceSnapshot, BalanceMovement, LoginEvent, OrderEvent])
+    database.execute_sql('ALTER TABLE "order" DROP COLUMN total')
+    database.execute_sql('ALTER TABLE "order" DROP COLUMN item_count')
+    MigrationHistory.delete().where(MigrationHistory.name >= '0003').execute()
+    MigrationHistory.insert_many([(name,) for name, _ in __all_migrations__[:2]],
+                                 fields=[MigrationHistory.name]).on_conflict_ignore().execute()
+
+    migrate()
+    check_migration()
+    assert [(item.product, item.quantity) for item in OrderProduct.select()] == [(1, 2)]
+    order = Order[order.id]
+    assert (order.total, order.item_count) == (6, 2)
+    assert database.pragma('foreign_keys') == 1
+
+
+def test_login_event_cascade(database):
+    """The login history created without cascade is rebuilt with it, without the logins of deleted users"""
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    user = User.create(first_name="First", name="Client", role=role, card_id="0", salt=salt, group_year=2022)
+    database.drop_tables([LoginEvent])
+    database.execute_sql('CREATE TABLE login_event (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, '
+                         'created_at DATETIME NOT NULL, succeeded INTEGER NOT NULL, partial INTEGER NOT NULL, '
+                         'FOREIGN KEY (user_id) REFERENCES "user" (id))')
+    database.pragma('foreign_keys', 0)
+    database.execute_sql("INSERT INTO login_event (user_id, created_at, succeeded, partial) "
+                         "VALUES (?, '2022-01-01', 1, 0), (?, '2022-01-01', 1, 0)", (user.id, user.id + 1))
+    database.pragma('foreign_keys', 1)
+    MigrationHistory.insert_many([(name,) for name, _ in __all_migrations__ if name != '0008_login_event_cascade'],
+                                 fields=[MigrationHistory.name]).execute()
+
+    migrate()
+    assert [event.user_id for event in LoginEvent.select()] == [user.id]
+    user.delete_instance()
+    assert LoginEvent.select().count() == 0
+    verify_indexes([(LoginEvent.index(LoginEvent.user, LoginEvent.created_at), ['user_id', 'created_at'])])
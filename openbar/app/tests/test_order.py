@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the checkout of orders
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from models.cardsalt import CardSalt
+from models.order import Order, OrderEvent, OrderStatus, order_events, validate_order, cancel_order_by, finish_the_order, \
+    set_order_product, set_order_products, check_order_totals
+from models.role import Role
+from models.user import User
+from tools.events import EventBroadcaster
+
+
+@pytest.fixture
+def client(database):
+    """Return a client with 10 in its balance"""
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    return User.create(first_name="First", name="Client", role=role, card_id="0",
+                       salt=salt, group_year=2022, balance=10)
+
+
+def basket(client: User, price: int) -> Order:
+    """Return a basket of the client with a total of price"""
+    order = Order.create(client=client)
+    set_order_product(order, 1, 1, unit_price=price)
+    return order
+
+
+def test_validate_debits_balance(client):
+    """Validating a basket debits its total and changes its status"""
+    order = basket(client, 7)
+    validate_order(order)
+    assert User[client.id].balance == 3
+    assert Order[order.id].status == OrderStatus.VALIDATED.value
+
+
+def test_validate_without_enough_money(client):
+    """A basket more expensive than the balance is refused and nothing is changed"""
+    order = basket(client, 7)
+    validate_order(order)
+    other = basket(client, 7)
+    with pytest.raises(HTTPException) as error:
+        validate_order(other)
+    assert error.value.status_code == 417
+    assert User[client.id].balance == 3
+    assert Order[other.id].status == OrderStatus.IN_BASKET.value
+
+
+def test_validate_twice(client):
+    """A basket validated by another request is not debited twice"""
+    order = basket(client, 4)
+    validate_order(Order[order.id])
+    with pytest.raises(HTTPException):
+        validate_order(order)
+    assert User[client.id].balance == 6
+
+
+def test_cancel_refunds_only_validated_orders(client):
+    """Cancelling an order gives the money back only if it was debited"""
+    barman = client
+    validated = basket(client, 4)
+    validate_order(validated)
+    cancel_order_by(validated, barman)
+    assert User[client.id].balance == 10
+    cancel_order_by(basket(client, 4), barman)
+    assert User[client.id].balance == 10
+
+
+def test_totals_follow_the_products(client):
+    """The stored totals are changed with the products of the basket"""
+    order = Order.create(client=client)
+    set_order_product(order, 1, 2, unit_price=3)
+    set_order_product(order, 2, 1, unit_price=4)
+    set_order_product(order, 1, 1, unit_price=3)
+    assert (Order[order.id].total, Order[order.id].item_count) == (7, 2)
+    set_order_product(order, 2, 0, unit_price=4)
+    assert (Order[order.id].total, Order[order.id].item_count) == (3, 1)
+    assert check_order_totals() == []
+
+
+def test_validated_order_is_not_changed(client):
+    """The products of a validated order can't be changed anymore"""
+    order = basket(client, 4)
+    validate_order(Order[order.id])
+    with pytest.raises(HTTPException):
+        set_order_product(order, 1, 2, unit_price=4)
+    assert Order[order.id].total == 4
+
+
+def test_check_order_totals(client):
+    """The checker finds the wrong totals and fixes them"""
+    order = basket(client, 4)
+    Order.update(total=1, item_count=5).where(Order.id == order.id).execute()
+    assert check_order_totals(fix=True) == [(order.id, 1, 5, 4, 1)]
+    assert check_order_totals() == []
+    assert Order[order.id].total == 4
+
+
+def test_set_several_products(client, count_queries):
+    """Several products are added, updated and removed with a fixed number of queries"""
+    order = basket(client, 4)
+    set_order_product(order, 2, 1, unit_price=4)
+    with count_queries() as counter:
+        items = set_order_products(order, {1: 3, 2: 0, 3: 2, 4: 1}, unit_price=2)
+    assert counter.count <= 6
+    assert sorted((item.product, item.quantity) for item in items) == [(1, 3), (3, 2), (4, 1)]
+    assert sorted((item.product, item.quantity) for item in Order[order.id].products) == [(1, 3), (3, 2), (4, 1)]
+    assert (Order[order.id].total, Order[order.id].item_count) == (18, 6)
+    assert check_order_totals() == []
+
+
+def test_status_changes_are_recorded(client):
+    """Each change of status is recorded as an event, the resuming clients get the ones they missed"""
+    order = basket(client, 4)
+    validate_order(order)
+    finish_the_order(order, client)
+    cancel_order_by(basket(client, 1), client)
+    events = order_events.since(0)
+    assert [(event.order.id, event.status) for event in events] == [
+        (order.id, OrderStatus.VALIDATED.value), (order.id, OrderStatus.FINISHED.value),
+        (order.id + 1, OrderStatus.CANCELLED.value)]
+    assert [event.id for event in order_events.since(events[0].id)] == [event.id for event in events[1:]]
+
+
+def test_events_are_only_read_with_subscribers(client, count_queries):
+    """The broadcaster doesn't poll without subscription, then pushes the events after the start of the subscription"""
+    broadcaster = EventBroadcaster('test_events', OrderEvent.select(OrderEvent, Order).join(Order), OrderEvent.id,
+                                   0.01, 10)
+    broadcaster.start()
+    try:
+        validate_order(basket(client, 1))
+        with count_queries() as counter:
+            broadcaster.wake()
+            time.sleep(0.1)
+        assert counter.count == 0
+
+        after_id = broadcaster.last_id()
+        # Written between the read of the start of the subscription and the subscription
+        written_while_subscribing = basket(client, 1)
+        validate_order(written_while_subscribing)
+
+        async def receive():
+            subscription = broadcaster.subscribe(after_id)
+            try:
+                await asyncio.sleep(0.05)
+                order = basket(client, 2)
+                await asyncio.to_thread(validate_order, order)
+                return order, [await subscription.get(1), await subscription.get(1)]
+            finally:
+                broadcaster.unsubscribe(subscription)
+
+        order, events = asyncio.run(receive())
+        assert [(event.order.id, event.status) for event in events] == [
+            (written_while_subscribing.id, OrderStatus.VALIDATED.value), (order.id, OrderStatus.VALIDATED.value)]
+    finally:
+        broadcaster.stop()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the pages and of the filters of the order lists
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from apis.order import get_orders, get_complete_orders, router
+from models.cardsalt import CardSalt
+from models.order import Order, OrderStatus
+from models.role import Role
+from models.user import User
+from tools.pagination import Page
+
+"""Creation date of the orders of the fixture, each one is an hour after the previous one"""
+START = datetime(2022, 9, 1, 18)
+
+
+@pytest.fixture
+def orders(database):
+    """Return 12 orders of two clients served by two barmen, with every status"""
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    users = [User.create(first_name="First", name=f"User {i}", role=role, card_id=str(i), salt=salt, group_year=2022)
+             for i in range(4)]
+    return [Order.create(client=users[i % 2], barman=users[2 + i // 6], status=OrderStatus(i % 4).value,
+                         created_at=START + timedelta(hours=i))
+            for i in range(12)]
+
+
+def read_all(list_orders, limit, **filters):
+    """Return the ids of the orders read page by page, and the number of pages"""
+    ids, pages, after_id = [], 0, None
+    while True:
+        page = list_orders(Page(after_id=after_id, limit=limit), filters.get('order_status'), filters.get('client'),
+                           filters.get('barman'), filters.get('created_after'), filters.get('created_before'))
+        pages += 1
+        ids += [order.id for order in page]
+        if len(page) < limit:
+            return ids, pages
+        after_id = page[-1].id
+
+
+def test_pages_follow_each_other(orders):
+    """Each order is read once, even when orders are created or deleted between two pages"""
+    first = get_orders(Page(after_id=None, limit=5), None, None, None, None, None)
+    assert [order.id for order in first] == [order.id for order in orders[:5]]
+    Order.delete_by_id(orders[2].id)
+    Order.delete_by_id(orders[6].id)
+    new = Order.create(client=orders[0].client, created_at=START - timedelta(days=1))
+    second = get_orders(Page(after_id=first[-1].id, limit=5), None, None, None, None, None)
+    assert [order.id for order in second] == [order.id for order in orders[5:6] + orders[7:11]]
+    last = get_orders(Page(after_id=second[-1].id, limit=5), None, None, None, None, None)
+    assert [order.id for order in last] == [orders[11].id, new.id]
+
+
+def test_pages_with_ties_on_the_dates(orders):
+    """The pages are sorted by the unique id, orders created at the same time are not lost between two pages"""
+    Order.update(created_at=START).execute()
+    ids, pages = read_all(get_orders, 5, created_after=START, created_before=START + timedelta(seconds=1))
+    assert ids == [order.id for order in orders]
+    assert pages == 3
+    ids, _ = read_all(get_orders, 4)
+    assert ids == [order.id for order in orders]
+
+
+@pytest.mark.parametrize('filters, expected', [
+    ({'order_status': OrderStatus.FINISHED.value}, lambda i: i % 4 == OrderStatus.FINISHED.value),
+    ({'client': 1}, lambda i: i % 2 == 0),
+    ({'barman': 4}, lambda i: i >= 6),
+    ({'created_after': START + timedelta(hours=3)}, lambda i: i >= 3),
+    ({'created_before': START + timedelta(hours=3)}, lambda i: i < 3),
+    ({'order_status': OrderStatus.VALIDATED.value, 'client': 2, 'barman': 3}, lambda i: i in (1, 5)),
+    ({'order_status': OrderStatus.IN_BASKET.value}, lambda i: i % 4 == OrderStatus.IN_BASKET.value),
+])
+def test_filters(orders, filters, expected):
+    ids, _ = read_all(get_orders, 2, **filters)
+    assert ids == [order.id for i, order in enumerate(orders) if expected(i)]
+    ids, _ = read_all(get_complete_orders, 2, **filters)
+    assert ids == [order.id for i, order in enumerate(orders)
+                   if expected(i) and order.status != OrderStatus.IN_BASKET.value]
+
+
+def test_status_filter_keeps_its_name():
+    """The status filter is still the query parameter status, without hiding the status module of starlette"""
+    routes = [route for route in router.routes if getattr(route, 'endpoint', None) in (get_orders, get_complete_orders)]
+    assert len(routes) == 2
+    for route in routes:
+        assert 'status' in [param.alias for param in route.dependant.query_params]
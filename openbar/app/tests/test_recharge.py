@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the recharges
+"""
+
+import pytest
+
+import models.recharge
+from models.cardsalt import CardSalt
+from models.recharge import Recharge, create_recharges
+from models.role import Role
+from models.user import User
+
+
+@pytest.fixture
+def users(database):
+    """Return two users with an empty balance"""
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    return [User.create(first_name="First", name=f"Client {i}", role=role, card_id=str(i),
+                        salt=salt, group_year=2022, balance=0)
+            for i in range(2)]
+
+
+def statements(counter, start: str) -> int:
+    """Return the number of queries counted starting with start"""
+    return sum(1 for sql, _ in counter.queries if sql.startswith(start))
+
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_create_recharges(users, count_queries, monkeypatch, returning):
+    """The recharges are inserted with one insert and the balances credited with one update
+    Without INSERT ... RETURNING, the ids are read back with one select.
+    """
+    monkeypatch.setattr(models.recharge, 'returning_supported', returning)
+    barman, client = users
+    Recharge.create(barman=barman, client=client, value=1)
+    User.update(balance=0).execute()
+    with count_queries() as counter:
+        recharges = create_recharges(barman, [(client.id, 5), (barman.id, 2), (client.id, 3)])
+    assert statements(counter, 'INSERT INTO "recharge"') == 1
+    assert statements(counter, 'UPDATE "user"') == 1
+    assert statements(counter, 'SELECT "t1"."id" FROM "recharge"') == (0 if returning else 1)
+    assert [(recharge.client_id, recharge.value) for recharge in recharges] == [(client.id, 5), (barman.id, 2),
+                                                                                (client.id, 3)]
+    assert [(Recharge[recharge.id].client_id, Recharge[recharge.id].value) for recharge in recharges] == \
+        [(recharge.client_id, recharge.value) for recharge in recharges]
+    assert Recharge.select().count() == 4
+    assert User[client.id].balance == 8
+    assert User[barman.id].balance == 2
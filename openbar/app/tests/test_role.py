@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the role tree, of the role permissions and of their caches
+"""
+
+import pytest
+from fastapi import HTTPException
+
+import apis.role
+import models.role
+from apis.role import delete_role, update_role
+from models.permission import LoginType, Range
+from models.role import Role, RolePermission, RolePermissionCache, RoleTreeCache, ancestors_cte, descendants_cte
+from schemas.role import RoleUpdate
+
+
+def cte_ids(cte):
+    return {row[0] for row in cte.select_from(cte.c.id).tuples()}
+
+
+@pytest.fixture
+def tree(database):
+    """Return a chain of 100 roles, the second one having also a branch of two roles"""
+    chain = [Role.create(name="Role 0")]
+    for i in range(1, 100):
+        chain.append(Role.create(name=f"Role {i}", parent=chain[-1]))
+    branch = Role.create(name="Branch", parent=chain[1])
+    leaf = Role.create(name="Leaf", parent=branch)
+    return chain, [branch, leaf]
+
+
+@pytest.fixture
+def tree_cache(monkeypatch):
+    """Replace the tree cached by the worker by an empty one"""
+    cache = RoleTreeCache(60)
+    monkeypatch.setattr(models.role, 'role_tree_cache', cache)
+    monkeypatch.setattr(apis.role, 'role_tree_cache', cache)
+    return cache
+
+
+def test_ctes_follow_a_deep_tree(tree):
+    chain, branch = tree
+    chain_ids = {role.id for role in chain}
+    branch_ids = {role.id for role in branch}
+    assert cte_ids(descendants_cte(chain[0].id)) == chain_ids | branch_ids
+    assert cte_ids(descendants_cte(chain[2].id)) == chain_ids - {chain[0].id, chain[1].id}
+    assert cte_ids(descendants_cte(branch[1].id)) == {branch[1].id}
+    assert cte_ids(ancestors_cte(branch[1].id)) == branch_ids | {chain[0].id, chain[1].id}
+    assert cte_ids(ancestors_cte(chain[-1].id)) == chain_ids
+    assert cte_ids(descendants_cte(-1)) == set()
+
+
+def test_ctes_stop_on_a_cycle(database):
+    """A cycle can't be created through the API, the recursion must end anyway"""
+    first = Role.create(name="First")
+    second = Role.create(name="Second", parent=first)
+    third = Role.create(name="Third", parent=second)
+    Role.update(parent=third).where(Role.id == first.id).execute()
+    ids = {first.id, second.id, third.id}
+    assert cte_ids(descendants_cte(second.id)) == ids
+    assert cte_ids(ancestors_cte(second.id)) == ids
+
+
+def test_tree_cache_answers_without_query(tree, count_queries):
+    chain, branch = tree
+    cache = RoleTreeCache(60)
+    with count_queries() as counter:
+        assert cache.is_ancestor(chain[1].id, branch[1].id)
+        assert not cache.is_ancestor(chain[2].id, branch[1].id)
+        assert chain[-1].id in cache.descendants(chain[1].id)
+    assert counter.count == 3
+    with count_queries() as counter:
+        assert cache.is_ancestor(chain[0].id, branch[1].id)
+        assert branch[0].id in cache.descendants(chain[1].id)
+    assert counter.count == 0
+
+
+def test_tree_cache_is_invalidated_by_a_role_update(tree, tree_cache):
+    chain, branch = tree
+    worker = RoleTreeCache(60)
+    assert worker.is_ancestor(chain[1].id, branch[1].id)
+    assert tree_cache.is_ancestor(chain[1].id, branch[1].id)
+
+    update_role(branch[0].id, RoleUpdate(parent=chain[0].id))
+    assert not tree_cache.is_ancestor(chain[1].id, branch[1].id)
+    assert tree_cache.is_ancestor(chain[0].id, branch[1].id)
+    # The other workers keep their tree until they read the version again
+    assert worker.is_ancestor(chain[1].id, branch[1].id)
+    assert not worker.is_ancestor(chain[1].id, branch[1].id, fresh=True)
+
+
+def test_update_refuses_a_descendant_as_parent(tree, tree_cache):
+    chain, branch = tree
+    assert not tree_cache.is_ancestor(branch[0].id, chain[50].id)
+    # Another worker moves the end of the chain under the branch, the check must not use the old tree
+    Role.update(parent=branch[1]).where(Role.id == chain[5].id).execute()
+    RoleTreeCache(60).invalidate()
+    with pytest.raises(HTTPException) as error:
+        update_role(branch[0].id, RoleUpdate(parent=chain[50].id))
+    assert error.value.status_code == 417
+    with pytest.raises(HTTPException) as error:
+        update_role(chain[0].id, RoleUpdate(parent=chain[0].id))
+    assert error.value.status_code == 417
+
+
+@pytest.fixture
+def barman(database):
+    """Return a role with a permission for the normal logins"""
+    role = Role.create(name="Barman")
+    RolePermission.create(role_id=role, permission="order.finish", login_type=LoginType.NORMAL_LOGIN.value,
+                          range=Range.EVERYONE.value)
+    return role
+
+
+def test_permission_cache_answers_without_query(barman, count_queries):
+    cache = RolePermissionCache(60)
+    with count_queries() as counter:
+        assert cache.get(barman.id, LoginType.NORMAL_LOGIN) == ["order.finish.2"]
+    assert counter.count == 2
+    with count_queries() as counter:
+        permissions = cache.get(barman.id, LoginType.NORMAL_LOGIN)
+        assert cache.get(barman.id, LoginType.PARTIAL_LOGIN) == []
+    assert counter.count == 0
+    permissions.append("user.delete.2")
+    assert cache.get(barman.id, LoginType.NORMAL_LOGIN) == ["order.finish.2"]
+
+
+def test_permission_cache_is_invalidated_by_a_permission_change(barman):
+    writer = RolePermissionCache(60)
+    worker = RolePermissionCache(60)
+    assert writer.get(barman.id, LoginType.PARTIAL_LOGIN) == []
+    assert worker.get(barman.id, LoginType.PARTIAL_LOGIN) == []
+
+    RolePermission.create(role_id=barman, permission="order.get", login_type=LoginType.PARTIAL_LOGIN.value,
+                          range=Range.SELF.value)
+    writer.invalidate()
+    assert writer.get(barman.id, LoginType.PARTIAL_LOGIN) == ["order.get.0"]
+    # The other workers keep the permissions until they read the version again
+    assert worker.get(barman.id, LoginType.PARTIAL_LOGIN) == []
+    worker.check_interval = 0
+    assert worker.get(barman.id, LoginType.PARTIAL_LOGIN) == ["order.get.0"]
+
+
+def test_permission_cache_is_invalidated_by_a_role_deletion(barman, monkeypatch, tree_cache):
+    cache = RolePermissionCache(60)
+    monkeypatch.setattr(apis.role, 'role_permission_cache', cache)
+    assert cache.get(barman.id, LoginType.NORMAL_LOGIN) == ["order.finish.2"]
+    delete_role(barman.id)
+    assert cache.get(barman.id, LoginType.NORMAL_LOGIN) == []
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Check that the list endpoints serialize their objects without one query per object
+"""
+
+import pytest
+
+from apis.order import get_orders, get_complete_orders
+from apis.recharge import get_all_recharges
+from apis.user import list_user
+from models.cardsalt import CardSalt
+from models.order import Order as OrderDAO, OrderStatus
+from models.recharge import Recharge as RechargeDAO
+from models.role import Role as RoleDAO
+from models.user import User as UserDAO
+from schemas.order import Order
+from schemas.recharge import RechargeOut
+from schemas.user import UserOut
+from tools.pagination import Page
+
+NB_OBJECTS = 20
+
+
+@pytest.fixture
+def bar(database):
+    """Fill the database with users, orders and recharges"""
+    role = RoleDAO.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    users = [UserDAO.create(first_name="First", name=f"User {i}", role=role, card_id=str(i),
+                            salt=salt, group_year=2022)
+             for i in range(NB_OBJECTS)]
+    for i, user in enumerate(users):
+        OrderDAO.create(client=user, barman=users[-1], status=OrderStatus(i % 4).value)
+        RechargeDAO.create(client=user, barman=users[-1], value=100)
+    return users
+
+
+def page():
+    """Return a page holding all the objects"""
+    return Page(after_id=None, limit=NB_OBJECTS)
+
+
+def test_list_user_queries(bar, count_queries):
+    """Listing users runs a single query"""
+    with count_queries() as counter:
+        users = [UserOut.from_orm(u) for u in list_user(page())]
+    assert len(users) == NB_OBJECTS
+    assert counter.count == 1
+
+
+def test_get_orders_queries(bar, count_queries):
+    """Listing orders runs a single query"""
+    with count_queries() as counter:
+        orders = [Order.from_orm(o) for o in get_orders(page(), None, None, None, None, None)]
+    assert len(orders) == NB_OBJECTS
+    assert all(o.client is not None and o.barman == bar[-1].id for o in orders)
+    assert counter.count == 1
+
+
+def test_get_complete_orders_queries(bar, count_queries):
+    """Listing complete orders runs a single query"""
+    with count_queries() as counter:
+        orders = [Order.from_orm(o) for o in get_complete_orders(page(), None, None, None, None, None)]
+    assert len(orders) == NB_OBJECTS * 3 // 4
+    assert counter.count == 1
+
+
+def test_get_all_recharges_queries(bar, count_queries):
+    """Listing recharges runs a single query"""
+    with count_queries() as counter:
+        recharges = [RechargeOut.from_orm(r) for r in get_all_recharges(page(), None, None, None, None)]
+    assert len(recharges) == NB_OBJECTS
+    assert counter.count == 1
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the users
+"""
+
+from datetime import date, datetime
+
+import pytest
+
+from models.cardsalt import CardSalt
+from models.role import Role
+from models.user import User, LastLoginTracker
+
+
+@pytest.fixture
+def users(database):
+    """Return three users who never logged in"""
+    role = Role.create(name="Client")
+    salt = CardSalt.create(year=2022, salt="0123456789abcdef")
+    return [User.create(first_name="First", name=f"Client {i}", role=role, card_id=str(i),
+                        salt=salt, group_year=2022)
+            for i in range(3)]
+
+
+def test_last_logins_are_written_together(users, count_queries):
+    """The last logins are written by one update at the flush, once per day"""
+    tracker = LastLoginTracker()
+    logins = [User[user.id] for user in users + users]
+    with count_queries() as counter:
+        for user in logins:
+            tracker.touch(user)
+    assert counter.count == 0
+    assert len(tracker) == 3
+    assert User[users[0].id].last_login is None
+    today = datetime.combine(date.today(), datetime.min.time())
+    assert logins[0].last_login == today
+    with count_queries() as counter:
+        assert tracker.flush() == 3
+    updates = [(sql, params) for sql, params in counter.queries if sql.startswith('UPDATE')]
+    assert len(updates) == 1
+    # The dates are sent as datetimes, PostgreSQL refuses to write text in the timestamp column
+    sql, params = updates[0]
+    assert 'CASE' in sql
+    assert [param for param in params if isinstance(param, (str, datetime))] == [today] * 3
+    assert all(User[user.id].last_login == today for user in users)
+    tracker.touch(User[users[0].id])
+    assert len(tracker) == 0
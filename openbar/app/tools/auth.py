@@ -5,6 +5,10 @@
 Set of function to check authorization before accessing the API.
 """
 
+import hashlib
+import hmac
+import os
+import time
 from typing import Optional, List
 
 from fastapi import HTTPException
@@ -12,13 +16,24 @@ from fastapi.params import Depends
 from fastapi.security import OAuth2PasswordBearer, HTTPBasicCredentials, HTTPBasic
 from starlette import status
 
+from config import TOKEN_CACHE_SIZE, TOKEN_CACHE_MAX_AGE, BASIC_AUTH_CACHE_TTL, BASIC_AUTH_CACHE_SIZE
 from models.permission import LoginType
 from models.user import User, verify_user_password, list_permissions
+from tools.cache import ExpiringLRUCache
 from tools.crypto import generate_user_token, decode_user_token
+from tools.executor import crypto_executor
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token", auto_error=False)
 basic_scheme = HTTPBasic(auto_error=False)
 
+"""Verified tokens of the worker: digest of the token -> (permissions, user snapshot)"""
+token_cache = ExpiringLRUCache(TOKEN_CACHE_SIZE)
+
+"""Successful HTTP Basic authentications of the worker: digest of the credentials -> (permissions, user snapshot)"""
+credential_cache = ExpiringLRUCache(BASIC_AUTH_CACHE_SIZE if BASIC_AUTH_CACHE_TTL > 0 else 0)
+"""Random key of the credential digests, so a dump of the memory can't be used to guess passwords"""
+credential_cache_key = os.urandom(32)
+
 
 def login_user(user, partial_login):
     """Return a token for a user."""
@@ -28,6 +43,25 @@ def login_user(user, partial_login):
     return generate_user_token(user.id, list_permissions(user, lt))
 
 
+def invalidate_user(user_id: int) -> None:
+    """Forget the cached authentications of a user, after it was updated or deleted"""
+    token_cache.discard_if(lambda entry: entry[1]['id'] == user_id)
+    credential_cache.discard_if(lambda entry: entry[1]['id'] == user_id)
+
+
+def credential_digest(credentials: HTTPBasicCredentials) -> bytes:
+    """Return the salted HMAC of a username and password"""
+    message = f"{len(credentials.username)}:{credentials.username}{credentials.password}"
+    return hmac.new(credential_cache_key, str.encode(message), hashlib.sha256).digest()
+
+
+def user_from_snapshot(snapshot: dict) -> User:
+    """Return an user built from the snapshot of its row, without querying the database"""
+    user = User(__no_default__=1, **snapshot)
+    user._dirty.clear()
+    return user
+
+
 async def get_current_user(token: Optional[str] = Depends(oauth2_scheme),
                            credentials: Optional[HTTPBasicCredentials] = Depends(basic_scheme))\
         -> tuple[User, List[str]]:
@@ -38,17 +72,28 @@ async def get_current_user(token: Optional[str] = Depends(oauth2_scheme),
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Basic"},
         )
+        digest = credential_digest(credentials)
+        cached = credential_cache.get(digest)
+        if cached is not None:
+            permissions, snapshot = cached
+            return user_from_snapshot(snapshot), permissions
         try:
-            user = User.get(User.username == credentials.username)
+            user = await crypto_executor.run(User.get, User.username == credentials.username)
         except User.DoesNotExist:
             raise incorrect
-        if not verify_user_password(user, credentials.password):
+        if not await crypto_executor.run(verify_user_password, user, credentials.password):
             raise incorrect
-        permissions = list_permissions(user, LoginType.PASSWORD)
+        permissions = await crypto_executor.run(list_permissions, user, LoginType.PASSWORD)
+        credential_cache.set(digest, (permissions, dict(user.__data__)), time.time() + BASIC_AUTH_CACHE_TTL)
         return user, permissions
     elif token is not None:
         # Checking token auth
-        decoded = decode_user_token(token)
+        token_digest = hashlib.sha256(str.encode(token)).digest()
+        cached = token_cache.get(token_digest)
+        if cached is not None:
+            permissions, snapshot = cached
+            return user_from_snapshot(snapshot), permissions
+        decoded = await crypto_executor.run(decode_user_token, token)
         if 'sub' not in decoded:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -57,7 +102,7 @@ async def get_current_user(token: Optional[str] = Depends(oauth2_scheme),
             )
         user_id = int(decoded['sub'])
         try:
-            user = User.get(User.id == user_id)
+            user = await crypto_executor.run(User.get, User.id == user_id)
         except User.DoesNotExist:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -73,6 +118,8 @@ async def get_current_user(token: Optional[str] = Depends(oauth2_scheme),
                 headers={"WWW-Authenticate": "Bearer"},
             )
         permissions = decoded['aud']
+        token_cache.set(token_digest, (permissions, dict(user.__data__)),
+                        min(decoded['exp'], time.time() + TOKEN_CACHE_MAX_AGE))
         return user, permissions
     else:
         raise HTTPException(
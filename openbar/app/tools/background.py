@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Periodic jobs run by each worker in the background
+"""
+
+import logging
+import threading
+from typing import Callable, Optional
+
+from tools.db import new_db_state, release_connection_after
+
+log = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Run a function every interval seconds in a thread, with its own database connection"""
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], None], run_on_stop: bool = False):
+        """
+        :param name: name of the thread
+        :param interval: number of seconds between two runs, 0 disables the task
+        :param fn: function to be run
+        :param run_on_stop: whether the function is run a last time when the task is stopped
+        """
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.run_on_stop = run_on_stop
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> None:
+        """Run the function, its errors are logged so the next runs still happen"""
+        try:
+            release_connection_after(self.fn)
+        except Exception:
+            log.exception("Background task %s failed", self.name)
+
+    def _loop(self) -> None:
+        new_db_state()
+        while not self._stopped.wait(self.interval):
+            self.run_once()
+        if self.run_on_stop:
+            self.run_once()
+
+    def start(self) -> None:
+        """Start running the function periodically"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the task and wait for its current run"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
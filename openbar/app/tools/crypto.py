@@ -6,7 +6,10 @@ Set of cryptographic function.
 For example there are the functions to hash password and card id
 """
 
+import hashlib
+import hmac
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import argon2
@@ -14,7 +17,13 @@ import jwt
 from fastapi import HTTPException
 from starlette import status
 
-from config import ISSUER_NAME, TOKEN_VALIDITY_TIME
+from config import ISSUER_NAME, TOKEN_VALIDITY_TIME, CARD_SEARCH_WORKERS
+
+"""Key of the card blind index. It must never be stored in the database."""
+CARD_INDEX_KEY = os.environ.get('CARD_INDEX_KEY', default=os.environ.get('SECRET_KEY', default="secretK"))
+
+"""Pool hashing a card ID with several salts at the same time (argon2 releases the GIL)"""
+card_hash_pool = ThreadPoolExecutor(max_workers=CARD_SEARCH_WORKERS, thread_name_prefix="card-hash")
 
 
 def generate_salt():
@@ -51,6 +60,13 @@ def hash_card_id(card_id, salt):
         .replace('\'', '')
 
 
+def card_blind_index(card_id):
+    """Return the keyed blind index of the given Card ID
+    Unlike the argon2 hash, it is deterministic so it can be looked up with a database index.
+    """
+    return hmac.new(str.encode(CARD_INDEX_KEY), str.encode(card_id), hashlib.sha256).hexdigest()
+
+
 def verify_hash(hash_string, string):
     """Verify if the given string correspond to the hash"""
     try:
@@ -6,19 +6,26 @@ Set of function to manage the database
 """
 
 import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from contextvars import ContextVar
+from typing import List, Optional
 
 import peewee
 from fastapi import Depends
-from playhouse.db_url import connect
+from playhouse.db_url import parse, schemes
 
 db_state_default = {"closed": None, "conn": None, "ctx": None, "transactions": None}
 db_state_current = ContextVar("db_state", default=db_state_default.copy())
 
 
 class PeeweeConnectionState(peewee._ConnectionState):
-    def __init__(self, **kwargs):
-        super().__setattr__("_state", db_state_current)
+    def __init__(self, state: ContextVar = db_state_current, **kwargs):
+        super().__setattr__("_state", state)
         super().__init__(**kwargs)
 
     def __setattr__(self, name, value):
@@ -28,27 +35,220 @@ class PeeweeConnectionState(peewee._ConnectionState):
         return self._state.get()[name]
 
 
-db = None
 db_uri = os.environ.get('DATABASE', default="sqlite:////tmp/db")
-is_sqlite = db_uri.startswith("sqlite:")
+is_sqlite = db_uri.startswith("sqlite")
+"""INSERT ... RETURNING needs SQLite 3.35, PostgreSQL always has it"""
+returning_supported = not is_sqlite or sqlite3.sqlite_version_info >= (3, 35, 0)
 
-if is_sqlite:
-    db = connect(db_uri, check_same_thread=False)
-else:
-    db = connect(db_uri)
+"""Maximum number of connections opened by each worker"""
+max_connections = int(os.environ.get('DATABASE_MAX_CONNECTIONS', default=8))
+"""Connections older than this number of seconds are recycled"""
+stale_timeout = int(os.environ.get('DATABASE_STALE_TIMEOUT', default=300))
+"""Number of seconds to wait for a free connection when they are all used"""
+pool_timeout = int(os.environ.get('DATABASE_POOL_TIMEOUT', default=10))
+
+
+def pooled_uri(uri: str) -> str:
+    """Return the URI of the pooled version of the given database"""
+    scheme, rest = uri.split('://', 1)
+    if not scheme.endswith('+pool'):
+        scheme += '+pool'
+    return f"{scheme}://{rest}"
 
-db._state = PeeweeConnectionState()
+
+"""Comma-separated URIs of the read replicas of the database, none by default"""
+replica_uris = [uri.strip() for uri in os.environ.get('DATABASE_REPLICAS', default="").split(',') if uri.strip()]
+
+"""Pragmas set on each SQLite connection
+With the WAL journal, the readers don't block the writer, and with synchronous=normal a commit only writes to the WAL,
+which is synced at the checkpoints. busy_timeout is the number of milliseconds a writer waits for another process.
+"""
+sqlite_pragmas = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', default='wal'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', default='normal'),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024)),
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE', default=64 * 1024)),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', default=5000)),
+    'foreign_keys': 1,
+}
+"""Number of times a SQLite write transaction tries again to begin when the database is still locked"""
+sqlite_write_retries = int(os.environ.get('SQLITE_WRITE_RETRIES', default=3))
+
+pool_params = {'max_connections': max_connections, 'stale_timeout': stale_timeout, 'timeout': pool_timeout}
+if is_sqlite:
+    pool_params['check_same_thread'] = False
+    pool_params['pragmas'] = sqlite_pragmas
+
+db_route_default = {"replica": None}
+db_route_current = ContextVar("db_route", default=db_route_default)
+
+
+class ReplicaRouting:
+    """Mixin of the primary database sending the queries of the read-only requests to their replica"""
+
+    def execute_sql(self, sql, params=None, commit=None):
+        replica = read_replica(self, sql)
+        if replica is not None:
+            return replica.execute_sql(sql, params)
+        return super().execute_sql(sql, params, commit)
+
+
+def open_database(uri: str, state: ContextVar, routing: bool = False) -> peewee.Database:
+    """
+    Return the pooled database of the URI
+    :param uri: URI of the database, without the pool
+    :param state: variable holding the connection state of the database in each context
+    :param routing: if the reads of the read-only requests are sent to the replicas
+    """
+    uri = pooled_uri(uri)
+    database_class = schemes[uri.split('://', 1)[0]]
+    if routing:
+        database_class = type(f"Routed{database_class.__name__}", (ReplicaRouting, database_class), {})
+    database = database_class(**parse(uri), **pool_params)
+    database._state = PeeweeConnectionState(state)
+    return database
+
+
+db = open_database(db_uri, db_state_current, routing=True)
+replicas: List[peewee.Database] = [
+    open_database(uri, ContextVar(f"db_state_replica_{i}", default=db_state_default.copy()))
+    for i, uri in enumerate(replica_uris)
+]
+
+
+"""Statements reading the database, a SELECT or a WITH, the recursive CTEs of the role tree for example"""
+_read_statement = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+"""Keywords of the statements writing or locking rows, even in a CTE or as SELECT ... FOR UPDATE"""
+_write_keyword = re.compile(r'\b(INSERT|UPDATE|DELETE|REPLACE|MERGE)\b', re.IGNORECASE)
+"""Quoted identifiers and string literals, which may contain the keywords"""
+_quoted = re.compile(r'"[^"]*"|\'[^\']*\'')
+
+
+def is_read_only(sql: str) -> bool:
+    """Check if a statement only reads the database, so it can run on a replica"""
+    return _read_statement.match(sql) is not None and _write_keyword.search(_quoted.sub('', sql)) is None
+
+
+def read_replica(primary: peewee.Database, sql: str) -> Optional[peewee.Database]:
+    """
+    Return the replica the query must be run on, None for the primary
+    The request runs all its queries on the primary from its first write or transaction,
+    so it reads what it wrote and its transactions see a single database.
+    """
+    route = db_route_current.get()
+    if route["replica"] is None:
+        return None
+    if primary.in_transaction() or not is_read_only(sql):
+        route["replica"] = None
+        return None
+    return route["replica"]
+
+
+_write_lock = threading.Lock()
+
+
+def _begin_immediate() -> peewee._atomic:
+    """Begin a transaction holding the write lock of the SQLite database, trying again while it is locked"""
+    for attempt in range(sqlite_write_retries + 1):
+        transaction = db.atomic('IMMEDIATE')
+        try:
+            transaction.__enter__()
+            return transaction
+        except peewee.OperationalError as error:
+            if 'locked' not in str(error) or attempt == sqlite_write_retries:
+                raise
+            time.sleep(0.01 * 2 ** attempt)
+
+
+@contextmanager
+def write_transaction():
+    """
+    Run the block in a transaction of the primary database, the writes of the models use it instead of db.atomic()
+    With SQLite, the threads of the worker write one at a time and the transaction takes the write lock when it begins:
+    a deferred transaction upgrading its read lock fails at once with "database is locked" when another process writes,
+    while BEGIN IMMEDIATE waits for it busy_timeout milliseconds, and is tried again sqlite_write_retries times.
+    """
+    if not is_sqlite or db.in_transaction():
+        with db.atomic():
+            yield
+        return
+    # The connection is taken first, so no thread waits for the pool while holding the lock
+    db.connection()
+    with _write_lock:
+        transaction = _begin_immediate()
+        try:
+            yield
+        except BaseException as error:
+            transaction.__exit__(type(error), error, error.__traceback__)
+            raise
+        else:
+            transaction.__exit__(None, None, None)
+
+
+def new_db_state():
+    """Give the current context its own connection state
+    The threads started by the app call it first, else they would all share the default state.
+    """
+    for database in (db, *replicas):
+        database._state._state.set(db_state_default.copy())
+        database._state.reset()
+    db_route_current.set(db_route_default)
 
 
 async def reset_db_state():
-    db._state._state.set(db_state_default.copy())
-    db._state.reset()
+    new_db_state()
+
+
+async def get_db(db_state=Depends(reset_db_state)):
+    """Give back to the pool the connection of the request
+    The connection is only taken from the pool by the first query of the request.
+    It is given back from the event loop, so it never waits for a thread of the threadpool
+    which may all be waiting for a connection.
+    """
+    try:
+        yield
+    finally:
+        close_connections()
 
 
-def get_db(db_state=Depends(reset_db_state)):
+async def get_read_db(db_state=Depends(reset_db_state)):
+    """Send the queries of a read-only request to one of the replicas, and give back its connections to the pools
+    The request moves to the primary at its first write. Without replica, it is get_db.
+    The replicas may lag behind the primary, the requests reading what a previous request wrote must use get_db.
+    """
+    if replicas:
+        db_route_current.set({"replica": random.choice(replicas)})
     try:
-        db.connect()
         yield
     finally:
-        if not db.is_closed():
-            db.close()
+        close_connections()
+
+
+def close_connections():
+    """Give back to the pools the connections taken by the current context"""
+    for database in (db, *replicas):
+        if not database.is_closed():
+            database.close()
+
+
+def release_connection_after(fn, *args):
+    """Run fn(*args) and give back to the pool the connection it took, if any
+    Jobs of bounded executors use it: a request never keeps a connection while waiting for an executor thread,
+    so executor threads waiting for a connection can't be waiting for the request.
+    """
+    closed = [database for database in (db, *replicas) if database.is_closed()]
+    try:
+        return fn(*args)
+    finally:
+        for database in closed:
+            if not database.is_closed():
+                database.close()
+
+
+def pool_stats() -> dict:
+    """Return the usage of the connection pool of the worker"""
+    return {
+        "max_connections": db.max_connections,
+        "in_use": len(db._in_use),
+        "idle": len(db._connections),
+    }
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Push of the new rows of an event table to the clients connected to the worker
+With PostgreSQL, the writers send the id of each event with NOTIFY and each worker LISTENs to them
+on its own connection.
+With SQLite, each worker reads the new events every few seconds, or as soon as it wrote one itself.
+A worker without subscription doesn't read the events, each subscription starts after a given event.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, List, Optional, Set
+
+import peewee as pw
+
+from tools.db import db, is_sqlite, new_db_state, release_connection_after
+
+log = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Queue of the events to be sent to one client"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, size: int, after_id: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(size)
+        self.after_id = after_id
+
+    def put(self, event: Any) -> None:
+        """Add an event to the queue, it must be called from the event loop
+        A client too slow to read its events is given None instead, so it is disconnected and resumes later.
+        """
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Any:
+        """Return the next event, None if the subscription is over
+        :raise asyncio.TimeoutError: if there was no event during timeout seconds
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventBroadcaster:
+    """Send the new events of a table to the subscriptions of the worker, from a thread"""
+
+    def __init__(self, channel: str, query: pw.ModelSelect, id_field: pw.Field,
+                 poll_interval: float, queue_size: int):
+        """
+        :param channel: name of the PostgreSQL notification channel
+        :param query: query of the events, with what the subscribers need joined
+        :param id_field: increasing identifier of the events
+        :param poll_interval: maximum time in seconds between two reads of the new events with SQLite
+        :param queue_size: number of events waiting to be sent to a client before it is disconnected
+        """
+        self.channel = channel
+        self.query = query
+        self.id_field = id_field
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._last_id: Optional[int] = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def last_id(self) -> int:
+        """Return the id of the last event, 0 if there is none"""
+        return self.query.model.select(pw.fn.COALESCE(pw.fn.MAX(self.id_field), 0)).scalar()
+
+    def subscribe(self, after_id: int) -> Subscription:
+        """Return a new subscription to the events after the given id, it must be called from the event loop
+        The events written before the subscription may not be pushed, the client reads them with since(after_id).
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size, after_id)
+        with self._lock:
+            first = not self._subscriptions
+            self._subscriptions.add(subscription)
+        if first:
+            # The polling thread waits for a subscription
+            self._wake.set()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop sending events to the subscription"""
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def since(self, after_id: int) -> List[Any]:
+        """Return the events after the given id, for the clients resuming their subscription"""
+        return list(self.query.where(self.id_field > after_id).order_by(self.id_field))
+
+    def notify(self, event_id: int) -> None:
+        """Tell the other workers about a new event, it must be called in the transaction creating it
+        PostgreSQL only delivers the notification when the transaction is committed.
+        """
+        if not is_sqlite:
+            db.execute_sql("SELECT pg_notify(%s, %s)", (self.channel, str(event_id)))
+
+    def wake(self) -> None:
+        """Read the new events of the worker without waiting for the next poll, once they are committed"""
+        self._wake.set()
+
+    def _dispatch(self, events: List[Any]) -> None:
+        if not events:
+            return
+        self._last_id = max(self._last_id or 0, *(getattr(event, self.id_field.name) for event in events))
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            for event in events:
+                if getattr(event, self.id_field.name) > subscription.after_id:
+                    subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+    def _read_new_events(self, ids: Optional[List[int]] = None) -> None:
+        if ids is None and self._last_id is None:
+            # The reads start after the oldest event the subscriptions wait for
+            with self._lock:
+                if not self._subscriptions:
+                    return
+                self._last_id = min(subscription.after_id for subscription in self._subscriptions)
+        if ids is not None:
+            query = self.query.where(self.id_field.in_(ids))
+        else:
+            query = self.query.where(self.id_field > self._last_id)
+        self._dispatch(release_connection_after(lambda: list(query.order_by(self.id_field))))
+
+    def _poll(self) -> None:
+        while not self._stopped.is_set():
+            if self._subscriptions:
+                self._wake.wait(self.poll_interval)
+            else:
+                # Nobody reads the events, the reads start again from the subscriptions
+                self._last_id = None
+                self._wake.wait()
+            self._wake.clear()
+            if not self._subscriptions:
+                continue
+            try:
+                self._read_new_events()
+            except Exception:
+                log.exception("Reading the new events of %s failed", self.channel)
+
+    def _listen(self) -> None:
+        import select
+
+        import psycopg2
+
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(database=db.database, **db.connect_params)
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {self.channel}")
+                # The notifications sent while the worker was not listening are lost
+                self._read_new_events()
+                while not self._stopped.is_set():
+                    if not select.select([connection], [], [], self.poll_interval)[0]:
+                        continue
+                    connection.poll()
+                    ids = [int(notification.payload) for notification in connection.notifies]
+                    connection.notifies.clear()
+                    if ids and self._subscriptions:
+                        self._read_new_events(ids)
+                    elif ids:
+                        # Nobody reads them, they must not be pushed to the next subscribers
+                        self._last_id = max(self._last_id or 0, *ids)
+            except Exception:
+                log.exception("Listening to %s failed", self.channel)
+                self._stopped.wait(self.poll_interval)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _run(self) -> None:
+        new_db_state()
+        self._last_id = None
+        if is_sqlite:
+            self._poll()
+        else:
+            self._listen()
+
+    def start(self) -> None:
+        """Start sending the events to the subscriptions"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=f"events-{self.channel}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread of the broadcaster"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
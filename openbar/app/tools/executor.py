@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Executor running the blocking work of the authentication outside of the event loop
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import CRYPTO_WORKERS
+from tools.db import release_connection_after
+
+log = logging.getLogger(__name__)
+
+
+class CryptoExecutor:
+    """
+    Bounded thread pool for argon2 hashes and the queries around them.
+    It keeps track of the number of waiting jobs and of the time they waited for a thread.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crypto")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._started = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool and return its result
+        The function is run in a copy of the current context so it uses the database connection of the request.
+        If the connection is taken from the pool by the function, it is given back at the end of the job.
+        """
+        context = contextvars.copy_context()
+        submitted_at = time.monotonic()
+
+        def job():
+            wait_time = time.monotonic() - submitted_at
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._started += 1
+                self._total_wait += wait_time
+                self._max_wait = max(self._max_wait, wait_time)
+                queued = self._queued
+            log.debug("%s waited %.2fms for a crypto thread (%d jobs queued)",
+                      fn.__name__, wait_time * 1000, queued)
+            try:
+                return context.run(release_connection_after, fn, *args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        with self._lock:
+            self._queued += 1
+        future = self._pool.submit(job)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            raise
+
+    def stats(self) -> dict:
+        """Return the queue depth and wait time metrics of the executor"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "mean_wait": self._total_wait / self._started if self._started else 0.0,
+                "max_wait": self._max_wait,
+            }
+
+
+crypto_executor = CryptoExecutor(CRYPTO_WORKERS)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Keyset pagination of the list endpoints
+"""
+
+from datetime import datetime
+from typing import Optional
+
+import peewee as pw
+from fastapi import Query
+
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+
+class Page:
+    """
+    Pagination parameters of a list endpoint.
+    Objects are sorted by identifier, the next page starts after the identifier of the last object received.
+    """
+
+    def __init__(self,
+                 after_id: Optional[int] = Query(None, description='Only return objects with a greater identifier'),
+                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE,
+                                    description='Maximum number of objects returned')):
+        self.after_id = after_id
+        self.limit = limit
+
+    def apply(self, query: pw.ModelSelect, id_field: pw.Field) -> pw.ModelSelect:
+        """Return the page of the query"""
+        if self.after_id is not None:
+            query = query.where(id_field > self.after_id)
+        return query.order_by(id_field).limit(self.limit)
+
+
+def filter_date_range(query: pw.ModelSelect, field: pw.Field,
+                      after: Optional[datetime], before: Optional[datetime]) -> pw.ModelSelect:
+    """Return the query restricted to the objects whose date field is in [after, before["""
+    if after is not None:
+        query = query.where(field >= after)
+    if before is not None:
+        query = query.where(field < before)
+    return query
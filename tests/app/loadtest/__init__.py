@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Load tests of the OpenBar API replaying a bar rush
+    python -m loadtest.seed --clients 200 --output users.json    (with the environment of the server)
+    python -m loadtest.rush --users users.json --duration 60 --output report.json
+    python -m loadtest.compare before.json report.json
+"""
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Comparison of two reports of loadtest.rush, for example of two commits
+    python -m loadtest.compare before.json after.json --threshold 10
+It prints the change of the throughput and of the latencies of each route, and exits with 1 when the p95 latency
+of a route grew by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+
+def change(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    """Return the relative change in percent, None if it can't be computed"""
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before * 100
+
+
+def format_change(before: Optional[float], after: Optional[float]) -> str:
+    if before is None or after is None:
+        return f"{'-':>24}"
+    delta = change(before, after)
+    delta = "" if delta is None else f"{delta:+.1f}%"
+    return f"{before:>8.1f} {after:>8.1f} {delta:>7}"
+
+
+def compare(before: dict, after: dict, threshold: float) -> List[str]:
+    """
+    Print the changes between the reports
+    :return: the routes whose p95 latency grew by more than threshold percent
+    """
+    print(f"before: {before['meta'].get('commit')} ({before['meta'].get('date')}), "
+          f"after: {after['meta'].get('commit')} ({after['meta'].get('date')})")
+    columns = ['requests/s', 'p50 ms', 'p95 ms', 'p99 ms']
+    print(f"{'route':<38}" + "".join(f"{column:>25}" for column in columns))
+    regressions = []
+    for route in sorted(set(before['routes']) | set(after['routes'])):
+        old = before['routes'].get(route)
+        new = after['routes'].get(route)
+        values = [(old and old['throughput'], new and new['throughput'])]
+        values += [(old and old['latency_ms'][rank], new and new['latency_ms'][rank]) for rank in ('p50', 'p95', 'p99')]
+        print(f"{route:<38}" + "".join(f" {format_change(*value)}" for value in values))
+        delta = change(*values[2])
+        if delta is not None and delta > threshold:
+            regressions.append(route)
+    print(f"{'total':<38} {format_change(before['throughput'], after['throughput'])}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before', help='report of the reference')
+    parser.add_argument('after', help='report to be compared to the reference')
+    parser.add_argument('--threshold', type=float, default=10, help='accepted growth of the p95 latency in percent')
+    args = parser.parse_args()
+
+    with open(args.before) as before, open(args.after) as after:
+        regressions = compare(json.load(before), json.load(after), args.threshold)
+    if regressions:
+        print(f"p95 latency up by more than {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Replay of a bar rush against a running server
+    python -m loadtest.rush --users users.json --clients 40 --bartenders 2 --duration 60 --output report.json
+Each client thread scans a card with its password on /auth/token, adds a few products to its basket and validates it.
+Each bartender thread finishes the validated orders, and sometimes recharges a client.
+The report gives the throughput, the status codes and the p50/p95/p99 latencies of each route in JSON.
+"""
+
+import argparse
+import json
+import math
+import os
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+
+from tests.openbar import API_ROOT
+
+"""Ids of the products put in the baskets"""
+PRODUCTS = list(range(1, 21))
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """Return the nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(rank / 100 * len(values)) - 1)]
+
+
+class Recorder:
+    """Latencies and status codes of the requests, by route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def call(self, session: requests.Session, method: str, route: str, url: str, **kwargs) \
+            -> Optional[requests.Response]:
+        """Send a request and record it under its route, return None if no response was received"""
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=30, **kwargs)
+            status = str(response.status_code)
+        except requests.RequestException:
+            response = None
+            status = 'error'
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.latencies[route].append(latency)
+            self.statuses[route][status] += 1
+        return response
+
+    def report(self, duration: float) -> dict:
+        """Return the statistics of each route, the latencies are in milliseconds"""
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            routes[route] = {
+                'requests': len(latencies),
+                'throughput': len(latencies) / duration,
+                'statuses': dict(self.statuses[route]),
+                'latency_ms': {
+                    'mean': sum(latencies) / len(latencies) * 1000,
+                    'p50': percentile(latencies, 50) * 1000,
+                    'p95': percentile(latencies, 95) * 1000,
+                    'p99': percentile(latencies, 99) * 1000,
+                    'max': latencies[-1] * 1000,
+                },
+            }
+        total = sum(route['requests'] for route in routes.values())
+        return {'requests': total, 'throughput': total / duration, 'routes': routes}
+
+
+def client(api: str, recorder: Recorder, cards: List[dict], orders: queue.Queue, stop: threading.Event,
+           think_time: float) -> None:
+    """Order at the bar until the end of the rush, with one of the cards of the thread each time
+    The form of /auth/token refuses an empty password, so the card is scanned with the password of its client.
+    """
+    rng = random.Random()
+    with requests.Session() as session:
+        while not stop.is_set():
+            card = rng.choice(cards)
+            response = recorder.call(session, 'POST', 'POST /auth/token', f"{api}auth/token",
+                                     data={'username': f"card_id:{card['card_id']}", 'password': card['password']})
+            if response is None or response.status_code != 200:
+                stop.wait(think_time or 0.1)
+                continue
+            headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+            for product in rng.sample(PRODUCTS, rng.randint(1, 3)):
+                recorder.call(session, 'PUT', 'PUT /order/basket/items/{product_id}',
+                              f"{api}order/basket/items/{product}", params={'quantity': rng.randint(1, 3)},
+                              headers=headers)
+            response = recorder.call(session, 'PUT', 'PUT /order/basket/validate', f"{api}order/basket/validate",
+                                     headers=headers)
+            if response is not None and response.status_code == 200:
+                orders.put(response.json()['id'])
+            stop.wait(rng.uniform(0, think_time))
+
+
+def bartender(api: str, recorder: Recorder, credentials: dict, clients: List[int], orders: queue.Queue,
+              stop: threading.Event, recharge_ratio: float) -> None:
+    """Finish the validated orders until the end of the rush, and recharge a client after some of them"""
+    rng = random.Random()
+    with requests.Session() as session:
+        response = recorder.call(session, 'POST', 'POST /auth/token', f"{api}auth/token",
+                                 data={'username': f"username:{credentials['username']}",
+                                       'password': credentials['password']})
+        if response is None or response.status_code != 200:
+            raise RuntimeError(f"The bartender {credentials['username']} can't log in")
+        session.headers['Authorization'] = f"Bearer {response.json()['access_token']}"
+        while not stop.is_set():
+            try:
+                order_id = orders.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            recorder.call(session, 'PUT', 'PUT /order/finish/{order_id}', f"{api}order/finish/{order_id}")
+            if rng.random() < recharge_ratio:
+                recorder.call(session, 'POST', 'POST /recharge/', f"{api}recharge/",
+                              json={'client': rng.choice(clients), 'value': 1000})
+
+
+def current_commit() -> Optional[str]:
+    """Return the commit of the working tree, the report is compared between commits"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def rush(api: str, users: dict, clients: int, bartenders: int, duration: float, think_time: float,
+         recharge_ratio: float) -> dict:
+    """Run the rush and return its report"""
+    recorder = Recorder()
+    orders: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    client_ids = [user['id'] for user in users['clients']]
+    if clients > len(client_ids):
+        raise ValueError(f"{clients} client threads need at least as many seeded clients")
+    # A card is only used by one thread, like a client is only at one place of the bar
+    threads = [threading.Thread(target=client, args=(api, recorder, users['clients'][i::clients], orders, stop,
+                                                     think_time))
+               for i in range(clients)]
+    threads += [threading.Thread(target=bartender,
+                                 args=(api, recorder, users['bartenders'][i % len(users['bartenders'])],
+                                       client_ids, orders, stop, recharge_ratio))
+                for i in range(bartenders)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    report = recorder.report(elapsed)
+    report['meta'] = {
+        'commit': current_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'api': api,
+        'clients': clients,
+        'bartenders': bartenders,
+        'duration': elapsed,
+        'think_time': think_time,
+        'recharge_ratio': recharge_ratio,
+        'orders_left': orders.qsize(),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', default='users.json', help='file written by loadtest.seed')
+    parser.add_argument('--api', default=API_ROOT, help='root of the API')
+    parser.add_argument('--clients', type=int, default=40, help='number of client threads')
+    parser.add_argument('--bartenders', type=int, default=2, help='number of bartender threads')
+    parser.add_argument('--duration', type=float, default=60, help='duration of the rush in seconds')
+    parser.add_argument('--think-time', type=float, default=0, help='maximum pause of a client between two orders')
+    parser.add_argument('--recharge-ratio', type=float, default=0.2, help='share of the orders followed by a recharge')
+    parser.add_argument('--output', help='file receiving the report, else it is printed')
+    args = parser.parse_args()
+
+    with open(args.users) as users_file:
+        users = json.load(users_file)
+    report = rush(args.api, users, args.clients, args.bartenders, args.duration, args.think_time,
+                  args.recharge_ratio)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    print(f"{report['requests']} requests, {report['throughput']:.0f} requests/s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Creation of the users of a load test, through the models of the server
+    python -m loadtest.seed --clients 200 --bartenders 4 --output users.json
+It must be run with the Python environment and the environment variables of the server (DATABASE, CARD_INDEX_KEY),
+never on a real database. The clients are credited through the recharges, so the ledger stays consistent.
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+from datetime import datetime
+
+"""Directory of the server, its modules are imported from there"""
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, 'openbar', 'app')
+
+
+def seed(clients: int, bartenders: int, balance: int) -> dict:
+    """
+    Create the users of the load test in the database of the server
+    :param clients: number of clients, logging in with their card and their password
+    :param bartenders: number of bartenders, logging in with their username and password
+    :param balance: initial balance of the clients
+    :return: the ids, card ids and passwords of the clients and the credentials of the bartenders
+    """
+    from models.cardsalt import CardSalt
+    from models.migration import migrate
+    from models.recharge import create_recharges
+    from models.role import Role
+    from models.user import User
+    from tools.crypto import card_blind_index, generate_salt, hash_card_id, hash_password
+    from tools.db import db
+
+    # Several seeds can be run on the same database
+    run = secrets.token_hex(4)
+    db.connect()
+    try:
+        migrate()
+        year = datetime.today().year
+        salt, _ = CardSalt.get_or_create(year=year, defaults={'salt': generate_salt()})
+        client_role, _ = Role.get_or_create(name="Load test client")
+        barman_role, _ = Role.get_or_create(name="Load test barman")
+
+        staff = []
+        for i in range(bartenders):
+            username = f"loadtest-{run}-barman-{i}"
+            password = secrets.token_urlsafe(12)
+            card_id = f"loadtest-{run}-barman-card-{i}"
+            User.create(first_name="Barman", name=str(i), role=barman_role, username=username,
+                        password=hash_password(password, generate_salt()), card_id=hash_card_id(card_id, salt.salt),
+                        card_index=card_blind_index(card_id), salt=salt, group_year=year)
+            staff.append({'username': username, 'password': password})
+
+        users = []
+        for i in range(clients):
+            card_id = f"loadtest-{run}-card-{i}"
+            password = secrets.token_urlsafe(12)
+            user = User.create(first_name="Client", name=str(i), role=client_role,
+                               password=hash_password(password, generate_salt()),
+                               card_id=hash_card_id(card_id, salt.salt), card_index=card_blind_index(card_id),
+                               salt=salt, group_year=year)
+            users.append({'id': user.id, 'card_id': card_id, 'password': password})
+
+        cashier = User.get(User.username == staff[0]['username'])
+        create_recharges(cashier, [(user['id'], balance) for user in users])
+    finally:
+        db.close()
+    return {'clients': users, 'bartenders': staff}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200, help='number of clients')
+    parser.add_argument('--bartenders', type=int, default=4, help='number of bartenders, at least one')
+    parser.add_argument('--balance', type=int, default=100000, help='initial balance of each client, in cents')
+    parser.add_argument('--app', default=APP_DIR, help='directory of the server')
+    parser.add_argument('--output', default='users.json', help='file receiving the users')
+    args = parser.parse_args()
+    if args.bartenders < 1:
+        parser.error("at least one bartender is needed to credit the clients")
+
+    sys.path.insert(0, os.path.abspath(args.app))
+    users = seed(args.clients, args.bartenders, args.balance)
+    with open(args.output, 'w') as output:
+        json.dump(users, output, indent=2)
+    print(f"{args.clients} clients and {args.bartenders} bartenders written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()